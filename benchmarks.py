@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Benchmarks never open a real window
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+import bouncingball
+import spaceshooting
+import tetris
+from entity_store import overlap_pairs
+
+SEED = 1234
+DEFAULT_BASELINE = 'bench_baseline.json'
+
+# Registered benchmarks in the order they run: (name, setup). setup() returns (run, prepare):
+# run(arg) is the timed call and prepare(), if not None, builds its argument untimed.
+benchmarks = []
+
+
+def benchmark(name):
+    def register(setup):
+        benchmarks.append((name, setup))
+        return setup
+    return register
+
+
+def measure(run, prepare=None, min_time=0.5, min_calls=5, max_calls=100000):
+    """
+    Call run until min_time seconds of calls have been timed (bounded by min_calls and
+    max_calls) and return ops/s and call-time percentiles in milliseconds.
+    """
+    for _ in range(3):  # Warm up caches and lazy initialisation
+        run(prepare() if prepare else None)
+    times = []
+    total = 0.0
+    while (total < min_time or len(times) < min_calls) and len(times) < max_calls:
+        arg = prepare() if prepare else None
+        start = time.perf_counter()
+        run(arg)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    ms = np.array(times) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'ops_per_sec': len(times) / total, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'calls': len(times)}
+
+
+# --- Tetris ---
+
+def tetris_locked(rng, full_rows, near_full_rows):
+    """
+    Locked positions with `full_rows` complete rows at the bottom and `near_full_rows`
+    rows above them that each miss one block.
+    """
+    locked = {}
+    color = tetris.shape_colors[0]
+    y = 19
+    for _ in range(full_rows):
+        for x in range(10):
+            locked[(x, y)] = color
+        y -= 1
+    for _ in range(near_full_rows):
+        gap = rng.randrange(10)
+        for x in range(10):
+            if x != gap:
+                locked[(x, y)] = color
+        y -= 1
+    return locked
+
+
+def tetris_pieces(rng, count=256):
+    """
+    Pieces at random positions and rotations across the board, valid or not.
+    """
+    pieces = []
+    for _ in range(count):
+        piece = tetris.Piece(rng.randrange(1, 9), rng.randrange(0, 20), rng.choice(tetris.shapes))
+        piece.rotation = rng.randrange(4)
+        pieces.append(piece)
+    return pieces
+
+
+def cycle(items):
+    state = {'i': 0}
+
+    def next_item():
+        state['i'] += 1
+        return items[state['i'] % len(items)]
+    return next_item
+
+
+for _label, _full, _near in (('near_full', 0, 16), ('full', 4, 12)):
+    @benchmark('tetris.valid_space.grid.%s' % _label)
+    def _setup(full=_full, near=_near):
+        rng = random.Random(SEED)
+        grid = tetris.create_grid(tetris_locked(rng, full, near))
+        return (lambda piece: tetris.valid_space(piece, grid)), cycle(tetris_pieces(rng))
+
+    @benchmark('tetris.valid_space.bitboard.%s' % _label)
+    def _setup(full=_full, near=_near):
+        rng = random.Random(SEED)
+        board = tetris.create_bitboard(tetris_locked(rng, full, near))
+        return (lambda piece: tetris.valid_space(piece, board)), cycle(tetris_pieces(rng))
+
+    @benchmark('tetris.clear_rows.%s' % _label)
+    def _setup(full=_full, near=_near):
+        locked = tetris_locked(random.Random(SEED), full, near)
+
+        def prepare():
+            fresh = dict(locked)
+            return tetris.create_grid(fresh), fresh
+        return (lambda args: tetris.clear_rows(*args)), prepare
+
+    @benchmark('tetris.draw_window.%s' % _label)
+    def _setup(full=_full, near=_near):
+        surface = pygame.Surface((tetris.s_width, tetris.s_height))
+        grid = tetris.create_grid(tetris_locked(random.Random(SEED), full, near))
+        piece = tetris.Piece(5, 0, tetris.T)
+
+        def run(_):
+            tetris.draw_window(surface, grid, 120)
+            tetris.draw_next_shape(piece, surface)
+        return run, None
+
+    @benchmark('tetris.renderer.full_redraw.%s' % _label)
+    def _setup(full=_full, near=_near):
+        renderer = tetris.TetrisRenderer(pygame.Surface((tetris.s_width, tetris.s_height)))
+        grid = tetris.create_grid(tetris_locked(random.Random(SEED), full, near))
+        piece = tetris.Piece(5, 0, tetris.T)
+
+        def run(_):
+            renderer.invalidate()
+            renderer.draw(grid, 120, piece)
+        return run, None
+
+
+@benchmark('tetris.state.step')
+def _setup():
+    state = tetris.TetrisState(SEED)
+    rng = random.Random(SEED)
+    actions = [rng.choice((tetris.NOOP, tetris.LEFT, tetris.RIGHT, tetris.ROTATE, tetris.DOWN)) for _ in range(1024)]
+    next_action = cycle(actions)
+
+    def run(action):
+        if state.lost:
+            state.__init__(SEED)
+        state.step(action, 10)
+    return run, next_action
+
+
+# --- Space shooter ---
+
+def shooter_with(count, rng):
+    """
+    A game with `count` bullets and `count` enemies scattered over the screen.
+    """
+    game = spaceshooting.SpaceShooter(SEED, max_bullets=count, max_enemies=count)
+    bullets = np.column_stack((rng.uniform(0, spaceshooting.WIDTH, count), rng.uniform(0, spaceshooting.HEIGHT - 120, count)))
+    enemies = np.column_stack((rng.uniform(0, spaceshooting.WIDTH, count), rng.uniform(0, spaceshooting.HEIGHT - 120, count)))
+    game.bullets.spawn_many(bullets, (spaceshooting.BULLET_WIDTH, spaceshooting.BULLET_HEIGHT), (0, -spaceshooting.bullet_speed))
+    game.enemies.spawn_many(enemies, (spaceshooting.ENEMY_WIDTH, spaceshooting.ENEMY_HEIGHT), (0, spaceshooting.enemy_speed))
+    return game
+
+
+for _count in (10, 100, 1000, 10000):
+    @benchmark('space.overlap_pairs.%d' % _count)
+    def _setup(count=_count):
+        game = shooter_with(count, np.random.default_rng(SEED))
+        bullets, enemies = game.bullets.boxes(), game.enemies.boxes()
+        return (lambda _: overlap_pairs(bullets, enemies)), None
+
+    @benchmark('space.collide.%d' % _count)
+    def _setup(count=_count):
+        rng = np.random.default_rng(SEED)
+        games = [shooter_with(count, rng) for _ in range(4)]
+        snapshots = [(g.bullets.pos.copy(), g.bullets.alive.copy(), g.enemies.pos.copy(), g.enemies.alive.copy()) for g in games]
+        next_game = cycle(list(zip(games, snapshots)))
+
+        def prepare():
+            # Restore a game to its scattered state; collide kills and compacts entities
+            game, (bullet_pos, bullet_alive, enemy_pos, enemy_alive) = next_game()
+            for store, pos, alive in ((game.bullets, bullet_pos, bullet_alive), (game.enemies, enemy_pos, enemy_alive)):
+                store.pos[:] = pos
+                store.alive[:] = alive
+                store.count = count
+            game.running = True
+            return game
+        return (lambda game: game.collide()), prepare
+
+    @benchmark('space.render.%d' % _count)
+    def _setup(count=_count):
+        game = shooter_with(count, np.random.default_rng(SEED))
+        renderer = spaceshooting.SpriteRenderer(pygame.Surface((spaceshooting.WIDTH, spaceshooting.HEIGHT)))
+        # Alternate between the scattered scene and the same scene one frame later, so every
+        # call redraws the same amount of movement
+        stores = (game.bullets, game.enemies)
+        frames = [[store.pos[:count].copy() for store in stores]]
+        frames.append([pos + store.vel[:count] for pos, store in zip(frames[0], stores)])
+        next_frame = cycle(frames)
+
+        def prepare():
+            for store, pos in zip(stores, next_frame()):
+                store.pos[:count] = pos
+            return game
+        return renderer.draw, prepare
+
+
+@benchmark('space.particles.50000')
+def _setup():
+    # Steady state of about 50k live particles: a 26-hit burst every frame, each living 40 frames
+    game = spaceshooting.SpaceShooter(SEED)
+    renderer = spaceshooting.SpriteRenderer(pygame.Surface((spaceshooting.WIDTH, spaceshooting.HEIGHT)))
+    rng = np.random.default_rng(SEED)
+
+    def run(_):
+        centers = rng.uniform((0, 0), (spaceshooting.WIDTH, spaceshooting.HEIGHT), (26, 2))
+        game.particles.emit(centers, spaceshooting.HIT_PARTICLES, 4.0, (40, 40), spaceshooting.explosion_colors)
+        game.particles.update()
+        renderer.draw(game)
+    for _ in range(40):
+        run(None)
+    return run, None
+
+
+@benchmark('space.headless_frame')
+def _setup():
+    game = spaceshooting.SpaceShooter(SEED)
+    frame = cycle(list(range(1000)))
+
+    def run(frame):
+        if not game.running:
+            game.__init__(SEED)
+        game.update(spaceshooting.autopilot(frame))
+    return run, frame
+
+
+# --- Bouncing ball ---
+
+for _dims, _balls in ((4, 1), (4, 1000), (8, 1), (8, 1000)):
+    @benchmark('ball.transform.%dd.%d' % (_dims, _balls))
+    def _setup(dims=_dims, balls=_balls):
+        animation = bouncingball.Animation(*bouncingball.hypercube(dims), balls=balls, radius=0.05, seed=SEED)
+        return (lambda _: bouncingball.project_points(bouncingball.apply_rotation(animation.points, 0.3, 0.2))), None
+
+    @benchmark('ball.frame.%dd.%d' % (_dims, _balls))
+    def _setup(dims=_dims, balls=_balls):
+        animation = bouncingball.Animation(*bouncingball.hypercube(dims), balls=balls, radius=0.05, seed=SEED)
+        surface = pygame.Surface((bouncingball.width, bouncingball.height))
+
+        def run(_):
+            animation.advance(1000 / 60)
+            animation.draw(surface)
+        return run, None
+
+
+def run_benchmarks(selected, min_time):
+    results = {}
+    for name, setup in selected:
+        results[name] = measure(*setup(), min_time=min_time)
+        stats = results[name]
+        print("%-40s %12.0f ops/s  p50 %8.4f  p95 %8.4f  p99 %8.4f ms" % (
+            name, stats['ops_per_sec'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each benchmark's throughput relative to the baseline and return the names that
+    got slower by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        ratio = stats['ops_per_sec'] / baseline[name]['ops_per_sec']
+        flag = ''
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("%-40s %6.2fx baseline%s" % (name, ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the games")
+    parser.add_argument('-k', metavar='TEXT', action='append', help="only run benchmarks whose name contains TEXT")
+    parser.add_argument('--list', action='store_true', help="list the benchmarks and exit")
+    parser.add_argument('--quick', action='store_true', help="time each benchmark for 0.1s instead of 0.5s")
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help="store the results as the baseline (default %s)" % DEFAULT_BASELINE)
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help="compare against a stored baseline and exit 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before a regression is reported")
+    args = parser.parse_args()
+
+    selected = [(name, setup) for name, setup in benchmarks if not args.k or any(k in name for k in args.k)]
+    if args.list:
+        print("\n".join(name for name, _ in selected))
+        sys.exit()
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    results = run_benchmarks(selected, 0.1 if args.quick else 0.5)
+
+    failed = []
+    if args.compare:
+        with open(args.compare) as f:
+            failed = compare(results, json.load(f)['results'], args.tolerance)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'seed': SEED, 'python': sys.version.split()[0], 'numpy': np.__version__,
+                       'pygame': pygame.version.ver, 'results': results}, f, indent=1, sort_keys=True)
+    pygame.quit()
+    sys.exit(1 if failed else 0)
@@ -1,13 +1,21 @@
-import pygame
+import argparse
+import itertools
 import math
+import os
 import sys
+import time
+from itertools import repeat
+
+import numpy as np
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # Keep stdout clean for --export -
+import pygame
+
+from frame_export import FrameWriter, rgb_surface
+from frame_profiler import FrameProfiler
+from game_loop import FixedTimestep
 
-# Initialize Pygame and set up the display
-pygame.init()
 width, height = 800, 600
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_caption("Ball Bouncing Inside a Tesseract")
-clock = pygame.time.Clock()
 
 # Global variables for projection
 screen_center_x = width // 2
@@ -17,133 +25,429 @@ scale = 200  # scale factor for projection
 # Simulation parameters
 restitution = 0.9       # how much energy is retained at each bounce
 gravity = 0.001         # acceleration along the y-axis (index 1)
+frame_ms = 1000 / 60    # speeds and gravity are given per frame of this length
+physics_hz = 120        # fixed rate of the physics steps
 
 # Ball parameters in 4D
 ball_radius = 0.1       # radius of the ball (in 4D units)
-ball_pos = [0.0, 0.0, 0.0, 0.0]   # initial 4D position
-ball_vel = [0.01, 0.015, 0.012, 0.008]  # initial 4D velocity
-
-# Define the tesseract (4D hypercube) vertices:
-# A tesseract has 16 vertices with coordinates at all combinations of -1 and 1.
-tesseract_vertices = []
-for x in [-1, 1]:
-    for y in [-1, 1]:
-        for z in [-1, 1]:
-            for w in [-1, 1]:
-                tesseract_vertices.append([x, y, z, w])
-
-# Define the edges of the tesseract:
-# Two vertices are connected if they differ in exactly one coordinate.
-tesseract_edges = []
-num_vertices = len(tesseract_vertices)
-for i in range(num_vertices):
-    for j in range(i + 1, num_vertices):
-        diff = 0
-        for k in range(4):
-            if tesseract_vertices[i][k] != tesseract_vertices[j][k]:
-                diff += 1
-        if diff == 1:
-            tesseract_edges.append((i, j))
-
-# --- 4D Rotation Functions ---
-# In 4D there are 6 independent planes of rotation. Here we define a helper that rotates
-# a 4D point in the plane spanned by two coordinate axes (given by indices i and j).
-def rotate4d(point, angle, i, j):
-    new_point = point.copy()
-    temp_i = new_point[i]
-    temp_j = new_point[j]
-    new_point[i] = temp_i * math.cos(angle) - temp_j * math.sin(angle)
-    new_point[j] = temp_i * math.sin(angle) + temp_j * math.cos(angle)
-    return new_point
-
-# For display we apply two rotations. For example, we rotate in:
-# • the XW plane (indices 0 and 3) and
-# • the YZ plane (indices 1 and 2).
-def apply_rotation(point, angle1, angle2):
-    p = rotate4d(point, angle1, 0, 3)  # rotate in X-W
-    p = rotate4d(p, angle2, 1, 2)       # rotate in Y-Z
-    return p
-
-# --- Projection Functions ---
-# We project from 4D → 3D using a simple perspective projection (using w as “depth”)
-# and then from 3D → 2D (using z as “depth”).
-def project_point(point4d):
-    # 4D to 3D projection
-    d4 = 3  # distance from the viewer in 4D
-    # Avoid division by zero if w gets too close to d4
-    factor4 = d4 / (d4 - point4d[3])
-    x3 = point4d[0] * factor4
-    y3 = point4d[1] * factor4
-    z3 = point4d[2] * factor4
-
-    # 3D to 2D projection
-    d3 = 3  # distance from the viewer in 3D
-    factor3 = d3 / (d3 - z3)
-    x2 = x3 * factor3
-    y2 = y3 * factor3
+ball_start = [0.0, 0.0, 0.0, 0.0]   # initial 4D position
+ball_start_vel = [0.01, 0.015, 0.012, 0.008]  # initial 4D velocity; repeats in higher dimensions
+
+
+def hypercube(n):
+    """
+    Return the vertices and edges of the n-dimensional hypercube with corners at ±1.
+    Vertex v has coordinate k = +1 where bit n-1-k of v is set, so vertices come out in
+    the same order as nested loops over the axes. Two vertices share an edge when their
+    indices differ in exactly one bit, so the edges are found by flipping each bit of
+    each index: O(V·n) rather than comparing all vertex pairs.
+    Returns (V, n) float vertices and (E, 2) int edges sorted by (i, j).
+    """
+    index = np.arange(1 << n)
+    bits = (index[:, None] >> np.arange(n - 1, -1, -1)) & 1
+    vertices = bits * 2.0 - 1.0
+
+    neighbours = index[:, None] ^ (1 << np.arange(n))
+    i, k = np.nonzero(neighbours > index[:, None])
+    edges = np.stack((i, neighbours[i, k]), axis=1)
+    return vertices, edges
+
+
+# A tesseract has 16 vertices with coordinates at all combinations of -1 and 1;
+# two vertices are connected if they differ in exactly one coordinate.
+tesseract_vertices, tesseract_edges = hypercube(4)
+
+# --- Rotation ---
+# In n dimensions there are n(n-1)/2 independent planes of rotation, each spanned by
+# two coordinate axes: 6 of them in 4D.
+
+
+def rotate_plane(angle, i, j, n=4):
+    """
+    Return the n x n matrix rotating by angle in the plane of axes i and j.
+    """
+    c, s = math.cos(angle), math.sin(angle)
+    matrix = np.identity(n)
+    matrix[i, i] = c
+    matrix[i, j] = -s
+    matrix[j, i] = s
+    matrix[j, j] = c
+    return matrix
+
+
+def rotation_matrix(angles, n=4):
+    """
+    Compose the rotations for a {plane: angle} mapping into a single n x n matrix.
+    The rotations are applied in the order the mapping lists them.
+    """
+    matrix = np.identity(n)
+    for (i, j), angle in angles.items():
+        if angle:
+            matrix = rotate_plane(angle, i, j, n) @ matrix
+    return matrix
+
+
+def display_angles(n, angle1, angle2):
+    """
+    The rotation shown on screen for n >= 3 dimensions. In 4D this turns
+    • the XW plane (indices 0 and 3) by angle1 and
+    • the YZ plane (indices 1 and 2) by angle2;
+    in higher dimensions every further axis also turns against one of X, Y, Z by angle1.
+    """
+    angles = {(0, n - 1): angle1, (1, 2): angle2}
+    for k in range(3, n - 1):
+        angles[(k % 3, k)] = angle1
+    return angles
+
+
+def apply_rotation(points, angle1, angle2):
+    """
+    Rotate an (m, n) array of points with one matrix product.
+    """
+    n = points.shape[1]
+    matrix = rotation_matrix(display_angles(n, angle1, angle2), n)
+    return points @ matrix.T
+
+
+# --- Projection ---
+# Each step is a simple perspective projection dropping the last axis, which acts as
+# “depth”: 4D → 3D uses w, then 3D → 2D uses z, and higher dimensions chain the same way.
+# A k-cube reaches out to sqrt(k), so above 4D a fixed distance would put vertices on or
+# behind the viewer. There each step views from distance / 2 * sqrt(k), as far out relative
+# to the cube as 4D's distance is to the tesseract, and then shrinks the result back into
+# the radius of a (k-1)-cube; the last two steps are always the tesseract's.
+def project_points(points, distance=3):
+    """
+    Project an (m, n) array of points to an (m, 2) array of integer screen coordinates.
+    distance is the viewer's distance along each dropped axis of the 4D → 3D → 2D steps.
+    """
+    points2d = points
+    ratio = distance / 2  # Viewing distance over the tesseract's radius
+    # With the viewer at ratio * r, a point within radius r projects to within this many r
+    stretch = ratio / math.sqrt(ratio * ratio - 1)
+    while points2d.shape[1] > 4:
+        k = points2d.shape[1]
+        radius = math.sqrt(k)
+        depth = ratio * radius
+        factor = depth / (depth - points2d[:, -1]) * (math.sqrt(k - 1) / (radius * stretch))
+        points2d = points2d[:, :-1] * factor[:, None]
+    while points2d.shape[1] > 2:
+        points2d = points2d[:, :-1] * (distance / (distance - points2d[:, -1]))[:, None]
 
     # Translate to screen coordinates
-    screen_x = screen_center_x + x2 * scale
-    screen_y = screen_center_y + y2 * scale
-    return (int(screen_x), int(screen_y))
-
-# --- Main Loop Rotation Angles for Display ---
-angle1 = 0.0
-angle2 = 0.0
-rotation_speed1 = 0.01
-rotation_speed2 = 0.008
-
-# --- Main Loop ---
-running = True
-while running:
-    dt = clock.tick(60)  # run at 60 FPS
-
-    # Process events
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # --- Update the 4D simulation for the ball ---
-    for i in range(4):
-        ball_pos[i] += ball_vel[i]
+    screen_xy = points2d * scale + (screen_center_x, screen_center_y)
+    return screen_xy.astype(int)
+
+
+def project_point(point4d):
+    """
+    Project a single point to screen coordinates.
+    """
+    return tuple(project_points(np.asarray([point4d], dtype=float))[0].tolist())
+
+
+def grid_pairs(points, cell_size):
+    """
+    Return index arrays (i, j), i < j, of every pair of points in the same or adjacent
+    cells of a uniform grid over the (N, k) points: a superset of all pairs closer than
+    cell_size. Points are sorted by cell once; each of the forward neighbour offsets is
+    then one vectorized searchsorted over all points.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(points) < 2:
+        return empty, empty
+    cells = np.floor(points / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0) - 1  # Leave an empty margin so neighbours never wrap
+    extent = cells.max(axis=0) + 2
+    strides = np.cumprod(np.concatenate(([1], extent[:-1])))
+    keys = cells @ strides
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    first, second = [], []
+    for offset in itertools.product((-1, 0, 1), repeat=points.shape[1]):
+        # Visit each unordered pair of cells once: only offsets that are lexicographically >= 0
+        if offset < (0,) * len(offset):
+            continue
+        target = keys + np.dot(offset, strides)
+        if any(offset):
+            start = np.searchsorted(keys, target, side='left')
+        else:
+            # Same cell: pair each point only with those after it
+            start = np.arange(1, len(keys) + 1)
+        runs = np.searchsorted(keys, target, side='right') - start
+        total = runs.sum()
+        if total == 0:
+            continue
+        a = np.repeat(np.arange(len(keys)), runs)
+        b = np.repeat(start, runs) + np.arange(total) - np.repeat(np.cumsum(runs) - runs, runs)
+        first.append(a)
+        second.append(b)
+
+    if not first:
+        return empty, empty
+    i = order[np.concatenate(first)]
+    j = order[np.concatenate(second)]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+class BallSystem:
+    """
+    N equal balls bouncing inside the ±1 hypercube, held as (N, n) position and velocity
+    arrays. Gravity, movement and wall bounces are applied to all balls at once.
+    Ball-ball collisions are elastic: a grid broad phase on up to three axes finds the
+    candidate pairs and the full n-dimensional distance test confirms them. The grid skips
+    the gravity axis, along which the balls pile up on the floor.
+    """
+
+    def __init__(self, count=1, dims=4, radius=ball_radius, seed=None):
+        self.radius = radius
+        if count == 1:
+            # The original single ball
+            self.pos = np.array([[ball_start[k % 4] for k in range(dims)]])
+            self.vel = np.array([[ball_start_vel[k % 4] for k in range(dims)]])
+        else:
+            rng = np.random.default_rng(seed)
+            self.pos = rng.uniform(-1 + radius, 1 - radius, (count, dims))
+            self.vel = rng.uniform(-0.015, 0.015, (count, dims))
+        self.collisions = 0  # Ball-ball collisions resolved in the last step
+
+    def __len__(self):
+        return len(self.pos)
+
+    def step(self, dt=1.0):
+        """
+        Advance every ball by dt frames (of frame_ms each).
+        """
+        pos, vel, r = self.pos, self.vel, self.radius
+        pos += vel * dt
         # Apply a tiny gravity along the y-axis (index 1)
-        if i == 1:
-            ball_vel[i] -= gravity
-
-        # Check for collisions with the axis-aligned tesseract boundaries
-        if ball_pos[i] + ball_radius > 1:
-            ball_pos[i] = 1 - ball_radius
-            ball_vel[i] = -ball_vel[i] * restitution
-        if ball_pos[i] - ball_radius < -1:
-            ball_pos[i] = -1 + ball_radius
-            ball_vel[i] = -ball_vel[i] * restitution
-
-    # --- Drawing ---
-    screen.fill((30, 30, 30))  # dark background
-
-    # First, compute the rotated and projected vertices of the tesseract.
-    projected_vertices = []
-    for vertex in tesseract_vertices:
-        rotated_vertex = apply_rotation(vertex, angle1, angle2)
-        proj = project_point(rotated_vertex)
-        projected_vertices.append(proj)
-
-    # Draw each tesseract edge
-    for edge in tesseract_edges:
-        p1 = projected_vertices[edge[0]]
-        p2 = projected_vertices[edge[1]]
-        pygame.draw.line(screen, (200, 200, 200), p1, p2, 1)
-
-    # Rotate and project the ball’s 4D position for display
-    rotated_ball = apply_rotation(ball_pos, angle1, angle2)
-    ball_screen = project_point(rotated_ball)
-    pygame.draw.circle(screen, (255, 100, 100), ball_screen, 8)
-
-    pygame.display.flip()
-
-    # Update display rotation angles
-    angle1 += rotation_speed1
-    angle2 += rotation_speed2
-
-pygame.quit()
-sys.exit()
+        vel[:, 1] -= gravity * dt
+
+        # Check for collisions with the axis-aligned hypercube boundaries
+        high = pos + r > 1
+        pos[high] = 1 - r
+        vel[high] *= -restitution
+        low = pos - r < -1
+        pos[low] = -1 + r
+        vel[low] *= -restitution
+
+        self.collisions = self.collide()
+
+    def pairs(self):
+        """
+        Return index arrays (i, j), i < j, of every pair of touching balls.
+        """
+        r = self.radius
+        axes = [k for k in range(self.pos.shape[1]) if k != 1][:3]
+        i, j = grid_pairs(self.pos[:, axes], 2 * r)
+        delta = self.pos[i] - self.pos[j]
+        touching = np.einsum('ij,ij->i', delta, delta) < (2 * r) ** 2
+        return i[touching], j[touching]
+
+    def collide(self):
+        """
+        Resolve ball-ball collisions and return how many pairs bounced.
+        Equal masses exchange their velocity components along the line between centres;
+        overlapping balls are also pushed apart so they don't stick together.
+        A ball touching several others gets the average of its pairs' responses, which
+        keeps dense piles from gaining energy.
+        """
+        i, j = self.pairs()
+        if len(i) == 0:
+            return 0
+        pos, vel = self.pos, self.vel
+
+        delta = pos[i] - pos[j]
+        distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        normal = delta / np.maximum(distance, 1e-12)[:, None]
+        contacts = np.bincount(np.concatenate((i, j)), minlength=len(pos)).astype(float)
+        share_i = (1 / contacts[i])[:, None]
+        share_j = (1 / contacts[j])[:, None]
+
+        # Only pairs that are still approaching exchange momentum
+        closing = np.einsum('ij,ij->i', vel[i] - vel[j], normal)
+        closing = np.minimum(closing, 0.0)[:, None] * normal
+        np.add.at(vel, i, -closing * share_i)
+        np.add.at(vel, j, closing * share_j)
+
+        push = ((2 * self.radius - distance) / 2)[:, None] * normal
+        np.add.at(pos, i, push * share_i)
+        np.add.at(pos, j, -push * share_j)
+        return len(i)
+
+
+# Pre-rendered ball sprite so every ball is drawn in one Surface.blits call
+_ball_sprite = None
+ball_sprite_radius = 8
+
+
+def ball_sprite():
+    """
+    Return the ball sprite, creating it on first use.
+    """
+    global _ball_sprite
+    if _ball_sprite is None:
+        size = 2 * ball_sprite_radius + 1
+        _ball_sprite = pygame.Surface((size, size))
+        _ball_sprite.set_colorkey((0, 0, 0))
+        pygame.draw.circle(_ball_sprite, (255, 100, 100), (ball_sprite_radius, ball_sprite_radius), ball_sprite_radius)
+    return _ball_sprite
+
+
+class Animation:
+    """
+    The bouncing balls and the turning hypercube as one animation, independent of any window.
+    advance(ms) runs the physics on fixed steps at `hz` steps per second, whatever the
+    frame rate; draw(surface) renders the balls interpolated between the last two steps.
+    """
+
+    # Display rotation per frame of frame_ms
+    rotation_speed1 = 0.01
+    rotation_speed2 = 0.008
+
+    def __init__(self, vertices=tesseract_vertices, edges=tesseract_edges, balls=1, radius=ball_radius,
+                 seed=None, hz=physics_hz):
+        self.vertex_count = len(vertices)
+        self.edges = np.asarray(edges).tolist()
+        self.system = BallSystem(balls, vertices.shape[1], radius, seed)
+        self.previous = self.system.pos.copy()
+        self.timestep = FixedTimestep(1000 / hz)
+        self.step_frames = self.timestep.step / frame_ms
+        self.angle1 = 0.0
+        self.angle2 = 0.0
+
+        # Vertices and balls are transformed together; the balls are the last rows
+        self.points = np.empty((len(vertices) + len(self.system), vertices.shape[1]))
+        self.points[:len(vertices)] = vertices
+
+    @property
+    def dims(self):
+        return self.points.shape[1]
+
+    def advance(self, ms):
+        """
+        Move the animation on by `ms` milliseconds.
+        """
+        # A slow frame runs more fixed steps to catch up instead of slowing the balls down
+        system = self.system
+        for _ in range(self.timestep.add(ms)):
+            self.previous[:] = system.pos
+            system.step(self.step_frames)
+
+        # Update display rotation angles
+        self.angle1 += self.rotation_speed1 * ms / frame_ms
+        self.angle2 += self.rotation_speed2 * ms / frame_ms
+
+    def draw(self, surface):
+        """
+        Draw the current frame onto surface from scratch.
+        """
+        surface.fill((30, 30, 30))  # dark background
+
+        # Rotate and project the hypercube and the balls in one pass
+        n = self.vertex_count
+        self.points[n:] = self.previous + (self.system.pos - self.previous) * self.timestep.alpha
+        projected = project_points(apply_rotation(self.points, self.angle1, self.angle2))
+        corners = (projected[n:] - ball_sprite_radius).tolist()
+        projected = projected.tolist()
+
+        # Draw each hypercube edge
+        for a, b in self.edges:
+            pygame.draw.line(surface, (200, 200, 200), projected[a], projected[b], 1)
+
+        surface.blits(zip(repeat(ball_sprite()), corners), False)
+
+
+def main(animation, fps=60, profiler=None):
+    """
+    Show the animation in a window at no more than `fps` frames per second.
+    A FrameProfiler, if given, times every phase of the loop.
+    """
+    if profiler is None:
+        profiler = FrameProfiler(enabled=False)
+    pygame.display.init()  # Fonts start on first use; no audio or joystick
+    screen = pygame.display.set_mode((width, height))
+    if animation.dims == 4:
+        pygame.display.set_caption("Ball Bouncing Inside a Tesseract")
+    else:
+        pygame.display.set_caption("Ball Bouncing Inside a %dD Hypercube" % animation.dims)
+    clock = pygame.time.Clock()
+
+    # --- Main Loop ---
+    running = True
+    while running:
+        profiler.frame()
+        dt = clock.tick(fps)  # run at 60 FPS
+        profiler.lap('wait')
+
+        # Process events
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            profiler.handle_event(event)
+        profiler.lap('events')
+
+        animation.advance(dt)
+        profiler.lap('update')
+        animation.draw(screen)
+        profiler.draw_overlay(screen)
+        profiler.lap('draw')
+        pygame.display.flip()
+        profiler.lap('flip')
+
+    pygame.quit()
+
+
+def export(animation, out, frames, fps=60, format='rgb', workers=None):
+    """
+    Render `frames` frames of the animation at `fps` offscreen, as fast as possible,
+    and stream them to `out` (see frame_export.FrameWriter). No window is opened.
+    Returns the FrameWriter, which holds the frame and byte counts.
+    """
+    surface = rgb_surface((width, height))
+    with FrameWriter(out, (width, height), format, workers) as writer:
+        for _ in range(frames):
+            animation.advance(1000 / fps)
+            animation.draw(surface)
+            writer.write(surface)
+    return writer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ball bouncing inside a hypercube")
+    parser.add_argument('--dims', type=int, default=4, help="number of dimensions (at least 3)")
+    parser.add_argument('--balls', type=int, default=1, help="number of balls")
+    parser.add_argument('--radius', type=float, default=ball_radius, help="ball radius in hypercube units")
+    parser.add_argument('--seed', type=int, help="RNG seed for the starting positions of many balls")
+    parser.add_argument('--hz', type=float, default=physics_hz, help="physics steps per second")
+    parser.add_argument('--fps', type=int, default=60, help="frame rate cap, or frame rate of an export")
+    parser.add_argument('--export', metavar='OUT',
+                        help="render offscreen to OUT ('-' for stdout, or e.g. frames/%%06d.png) instead of a window")
+    parser.add_argument('--format', choices=['rgb', 'png'], default='rgb', help="exported frame format")
+    parser.add_argument('--frames', type=int, default=600, help="number of frames to export")
+    parser.add_argument('--workers', type=int, help="PNG encoder threads (default: one per CPU)")
+    parser.add_argument('--profile', action='store_true', help="time each frame phase; F3 shows the overlay")
+    parser.add_argument('--trace', metavar='PATH', help="with --profile, write the frame timings to a .csv or .json file")
+    args = parser.parse_args()
+    if args.dims < 3:
+        parser.error("--dims must be at least 3")
+
+    animation = Animation(*hypercube(args.dims), balls=args.balls, radius=args.radius, seed=args.seed, hz=args.hz)
+    if args.export:
+        start = time.perf_counter()
+        writer = export(animation, args.export, args.frames, args.fps, args.format, args.workers)
+        elapsed = time.perf_counter() - start
+        print("%d frames (%.1fs of animation) in %.2fs, %.0f frames/s, %.1f MB" % (
+            writer.frames, writer.frames / args.fps, elapsed, writer.frames / elapsed, writer.bytes / 1e6),
+            file=sys.stderr)
+    else:
+        profiler = FrameProfiler(('wait', 'events', 'update', 'draw', 'flip'), enabled=args.profile or args.trace is not None)
+        try:
+            main(animation, args.fps, profiler)
+        finally:
+            if profiler.enabled:
+                print("\n".join(profiler.report()))
+                if args.trace:
+                    profiler.dump(args.trace)
+    sys.exit()
@@ -0,0 +1,199 @@
+import numpy as np
+
+
+class EntityStore:
+    """
+    Struct-of-arrays store for axis-aligned entities (bullets, enemies, ...).
+    Positions, velocities, sizes and alive flags live in preallocated NumPy arrays whose
+    capacity doubles when full. Live entities are kept packed in [0, count) in spawn order,
+    so every update is a slice operation over exactly the live entities.
+    Every entity also gets a serial id that survives compaction; since spawn order is
+    kept, the live ids are always sorted.
+
+    With fixed=True the store is a fixed-capacity pool: slots freed by compact are reused
+    and nothing is ever reallocated; spawns beyond capacity are dropped and counted.
+    """
+
+    def __init__(self, capacity=64, fixed=False):
+        self.count = 0
+        self.fixed = fixed
+        self.high_water = 0  # Most entities ever alive at once
+        self.exhausted = 0  # Spawns dropped because a fixed pool was full
+        self.next_id = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        pos = np.zeros((capacity, 2), dtype=np.float32)
+        vel = np.zeros((capacity, 2), dtype=np.float32)
+        size = np.zeros((capacity, 2), dtype=np.float32)
+        alive = np.zeros(capacity, dtype=bool)
+        ids = np.zeros(capacity, dtype=np.int64)
+        if self.count:
+            n = self.count
+            pos[:n] = self.pos[:n]
+            vel[:n] = self.vel[:n]
+            size[:n] = self.size[:n]
+            alive[:n] = self.alive[:n]
+            ids[:n] = self.ids[:n]
+        self.pos, self.vel, self.size, self.alive, self.ids = pos, vel, size, alive, ids
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, x, y, w, h, vx=0.0, vy=0.0):
+        """
+        Add one entity and return its index (valid until the next compact),
+        or None if a fixed pool is full.
+        """
+        if self.count == self.capacity:
+            if self.fixed:
+                self.exhausted += 1
+                return None
+            self._allocate(self.capacity * 2)
+        i = self.count
+        self.pos[i] = x, y
+        self.vel[i] = vx, vy
+        self.size[i] = w, h
+        self.alive[i] = True
+        self.ids[i] = self.next_id
+        self.next_id += 1
+        self.count += 1
+        if self.count > self.high_water:
+            self.high_water = self.count
+        return i
+
+    def spawn_many(self, xy, size, vel=(0.0, 0.0)):
+        """
+        Add len(xy) entities at once; size and vel broadcast against xy.
+        A fixed pool takes as many as fit. Returns the number added.
+        """
+        k = len(xy)
+        if self.fixed:
+            room = self.capacity - self.count
+            if k > room:
+                self.exhausted += k - room
+                k = room
+                xy = xy[:k]
+                if np.ndim(size) == 2:
+                    size = size[:k]
+                if np.ndim(vel) == 2:
+                    vel = vel[:k]
+        else:
+            while self.count + k > self.capacity:
+                self._allocate(self.capacity * 2)
+        new = slice(self.count, self.count + k)
+        self.pos[new] = xy
+        self.size[new] = size
+        self.vel[new] = vel
+        self.alive[new] = True
+        self.ids[new] = np.arange(self.next_id, self.next_id + k)
+        self.next_id += k
+        self.count += k
+        self.high_water = max(self.high_water, self.count)
+        return k
+
+    def move(self):
+        """
+        Advance every live entity by its velocity.
+        """
+        n = self.count
+        self.pos[:n] += self.vel[:n]
+
+    def boxes(self):
+        """
+        Return an (n, 4) array of (left, top, right, bottom) for the live entities.
+        """
+        n = self.count
+        return np.concatenate((self.pos[:n], self.pos[:n] + self.size[:n]), axis=1)
+
+    def stats(self):
+        """
+        Return pool statistics: live count, capacity, high-water mark and exhaustion count.
+        """
+        return {
+            'live': self.count,
+            'capacity': self.capacity,
+            'high_water': self.high_water,
+            'exhausted': self.exhausted,
+        }
+
+    def compact(self):
+        """
+        Drop dead entities, keeping the survivors packed and in order.
+        """
+        n = self.count
+        keep = np.flatnonzero(self.alive[:n])
+        if len(keep) == n:
+            return
+        m = len(keep)
+        self.pos[:m] = self.pos[keep]
+        self.vel[:m] = self.vel[keep]
+        self.size[:m] = self.size[keep]
+        self.ids[:m] = self.ids[keep]
+        self.alive[:m] = True
+        self.alive[m:n] = False
+        self.count = m
+
+
+def _cell_entries(boxes, cell_size):
+    """
+    Expand each box into one entry per grid cell it overlaps.
+    Returns (cell keys, box ids, cell x, cell y, first cell of each box).
+    """
+    lo = np.floor_divide(boxes[:, :2], cell_size).astype(np.int64)
+    hi = np.floor_divide(boxes[:, 2:] - 1e-3, cell_size).astype(np.int64)
+    span = hi - lo + 1
+    counts = span[:, 0] * span[:, 1]
+    ids = np.repeat(np.arange(len(boxes)), counts)
+
+    # Position of every entry within its box's block of cells
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = lo[ids, 0] + k % span[ids, 0]
+    cy = lo[ids, 1] + k // span[ids, 0]
+    return (cx << 32) + (cy & 0xFFFFFFFF), ids, cx, cy, lo
+
+
+def overlap_pairs(a, b, cell_size=64):
+    """
+    Return index arrays (i, j) of every overlapping pair between box arrays a and b,
+    as produced by EntityStore.boxes, sorted by i then j.
+    A uniform grid narrows the candidates before the exact AABB test, all vectorized.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(a) == 0 or len(b) == 0:
+        return empty, empty
+
+    keys_a, ids_a, cx, cy, lo_a = _cell_entries(a, cell_size)
+    keys_b, ids_b, _, _, lo_b = _cell_entries(b, cell_size)
+    order = np.argsort(keys_b, kind='stable')
+    keys_b, ids_b = keys_b[order], ids_b[order]
+
+    # For every a-entry, the run of b-entries with the same cell key
+    start = np.searchsorted(keys_b, keys_a, side='left')
+    runs = np.searchsorted(keys_b, keys_a, side='right') - start
+    total = runs.sum()
+    if total == 0:
+        return empty, empty
+    entry = np.repeat(np.arange(len(keys_a)), runs)
+    offsets = np.arange(total) - np.repeat(np.cumsum(runs) - runs, runs)
+    i = ids_a[entry]
+    j = ids_b[np.repeat(start, runs) + offsets]
+
+    # Boxes sharing several cells meet in each of them; keep only the meeting in the
+    # cell holding the top-left corner of their intersection, so every pair appears once
+    first = (
+        (cx[entry] == np.maximum(lo_a[i, 0], lo_b[j, 0]))
+        & (cy[entry] == np.maximum(lo_a[i, 1], lo_b[j, 1]))
+    )
+    i, j = i[first], j[first]
+
+    hit = (
+        (a[i, 0] < b[j, 2]) & (b[j, 0] < a[i, 2])
+        & (a[i, 1] < b[j, 3]) & (b[j, 1] < a[i, 3])
+    )
+    i, j = i[hit], j[hit]
+
+    # Entries are grouped by cell, not by i; restore (i, j) order
+    order = np.lexsort((j, i))
+    return i[order], j[order]
@@ -0,0 +1,201 @@
+import csv
+import json
+import time
+
+import pygame
+
+import text_cache
+
+np = None  # numpy, imported by the first profiler that needs it so a disabled one costs no import
+
+
+def _import_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+# Colours of the phases in the overlay graph, in order; the frame time itself is white
+phase_colors = [
+    (90, 160, 255),
+    (255, 200, 60),
+    (255, 90, 90),
+    (90, 220, 120),
+    (200, 120, 255),
+    (120, 220, 220),
+]
+
+
+class FrameProfiler:
+    """
+    Per-phase frame timings for a game loop, kept in a ring buffer of `size` frames: the one
+    being timed and the last size - 1 finished ones.
+    Call frame() at the top of every loop iteration and lap(phase) after each phase; the
+    time since the previous lap is charged to that phase, and the time between two frame()
+    calls is the frame time. Both cost a perf_counter call and an array write, and nothing
+    at all when the profiler is disabled. Call pause() before the loop stops for a while,
+    e.g. for a menu, so the gap is not taken for a frame.
+
+    F3 toggles an overlay graphing the recent frames with their p50/p95/p99 frame times,
+    and dump writes the buffered trace as CSV or JSON.
+    """
+
+    def __init__(self, phases=('wait', 'events', 'update', 'collide', 'draw', 'flip'), size=600, enabled=True,
+                 toggle_key=pygame.K_F3):
+        self.phases = list(phases)
+        self.columns = {phase: i for i, phase in enumerate(self.phases)}
+        self.size = size
+        self.enabled = enabled
+        self.toggle_key = toggle_key
+        self.times = None  # Seconds, (size, phases + 1); the last column is the frame time
+        if enabled:
+            _import_numpy()
+            self.times = np.zeros((size, len(self.phases) + 1))
+        self.count = 0  # Frames completed so far
+        self.start = None
+        self.mark = None
+        self.visible = False
+        self.labels = None
+
+    def frame(self):
+        """
+        Close the previous frame and start timing a new one.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.start is not None:
+            self._close(now)
+        self.start = self.mark = now
+
+    def pause(self):
+        """
+        Close the frame being timed at its last lap and stop timing until the next frame()
+        call, so time spent outside the loop, in a menu or a delay, is not charged to a frame.
+        """
+        if not self.enabled or self.start is None:
+            return
+        if self.mark > self.start:
+            self._close(self.mark)
+        self.start = self.mark = None
+
+    def _close(self, end):
+        self.times[self.count % self.size, -1] = end - self.start
+        self.count += 1
+        self.times[self.count % self.size] = 0.0
+
+    def lap(self, phase):
+        """
+        Charge the time since the last lap (or the start of the frame) to `phase`.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.times[self.count % self.size, self.columns[phase]] += now - self.mark
+        self.mark = now
+
+    def recent(self):
+        """
+        Return the buffered finished frames, oldest first, as an (n, phases + 1) array of
+        milliseconds. The frame still being timed is left out.
+        """
+        _import_numpy()
+        if self.times is None:
+            return np.zeros((0, len(self.phases) + 1))
+        if self.count < self.size:
+            return self.times[:self.count] * 1000
+        # Once wrapped, the row being timed comes first after rolling and the last size - 1 follow
+        return np.roll(self.times, -(self.count % self.size), axis=0)[1:] * 1000
+
+    def summary(self):
+        """
+        Return {phase: {'mean', 'p50', 'p95', 'p99'}} in milliseconds over the buffered frames,
+        with the whole frame under 'frame'.
+        """
+        times = self.recent()
+        if len(times) == 0:
+            return {}
+        percentiles = np.percentile(times, [50, 95, 99], axis=0)
+        means = times.mean(axis=0)
+        return {
+            name: {'mean': means[i], 'p50': percentiles[0, i], 'p95': percentiles[1, i], 'p99': percentiles[2, i]}
+            for i, name in enumerate(self.phases + ['frame'])
+        }
+
+    def report(self):
+        """
+        Return the summary as printable lines.
+        """
+        lines = ["%-8s %8s %8s %8s %8s  (ms over %d frames)" % ('phase', 'mean', 'p50', 'p95', 'p99', len(self.recent()))]
+        for name, stats in self.summary().items():
+            lines.append("%-8s %8.3f %8.3f %8.3f %8.3f" % (name, stats['mean'], stats['p50'], stats['p95'], stats['p99']))
+        return lines
+
+    def dump(self, path):
+        """
+        Write the buffered frames to path: JSON with a summary if it ends in .json, else CSV.
+        """
+        times = self.recent()
+        first = self.count - len(times)
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({
+                    'phases': self.phases,
+                    'summary': self.summary(),
+                    'frames': [[first + k] + row for k, row in enumerate(times.tolist())],
+                }, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame'] + ['%s_ms' % phase for phase in self.phases] + ['frame_ms'])
+                for k, row in enumerate(times.tolist()):
+                    writer.writerow([first + k] + ['%.4f' % value for value in row])
+
+    def handle_event(self, event):
+        """
+        Toggle the overlay on the toggle key. Returns True if the overlay was toggled,
+        so a dirty-rect renderer knows to redraw what the overlay covered.
+        """
+        if self.enabled and event.type == pygame.KEYDOWN and event.key == self.toggle_key:
+            self.visible = not self.visible
+            return True
+        return False
+
+    def draw_overlay(self, surface, topleft=(10, 10), width=220, height=110, scale_ms=2000 / 60):
+        """
+        Draw the overlay if it is visible and return the list of rects it covered.
+        The graph shows the last `width` frames: each working phase stacked from the bottom
+        (time spent in a 'wait' phase is left out) and the whole frame time in white, against
+        a line at one 60 FPS frame; the full height is scale_ms.
+        """
+        if not self.visible:
+            return []
+        rect = pygame.Rect(topleft, (width, height))
+        surface.fill((20, 20, 20), rect)
+        graph = pygame.Rect(rect.x, rect.y + 30, width, height - 30)
+
+        times = self.recent()[-width:]
+        if len(times) > 1:
+            xs = np.arange(len(times)) + graph.x + width - len(times)
+            working = [i for i, phase in enumerate(self.phases) if phase != 'wait']
+            stacked = np.cumsum(times[:, working], axis=1)
+            stacked = np.concatenate((stacked, times[:, -1:]), axis=1)
+            ys = graph.bottom - 1 - np.minimum(stacked / scale_ms, 1) * (graph.height - 1)
+            for k, i in enumerate(working):
+                color = phase_colors[i % len(phase_colors)]
+                pygame.draw.lines(surface, color, False, np.stack((xs, ys[:, k]), axis=1).tolist())
+            pygame.draw.lines(surface, (255, 255, 255), False, np.stack((xs, ys[:, -1]), axis=1).tolist())
+
+        frame_y = graph.bottom - 1 - (1000 / 60 / scale_ms) * (graph.height - 1)
+        pygame.draw.line(surface, (110, 110, 110), (graph.x, frame_y), (graph.right - 1, frame_y))
+
+        # Refresh the numbers twice a second rather than rendering new text every frame
+        if self.labels is None or self.count % 30 == 0:
+            stats = self.summary().get('frame')
+            if stats is not None:
+                text = "p50 %.1f  p95 %.1f  p99 %.1f ms" % (stats['p50'], stats['p95'], stats['p99'])
+            else:
+                text = "measuring..."
+            self.labels = text_cache.render(text, 18, (255, 255, 255))
+        surface.blit(self.labels, (rect.x + 5, rect.y + 5))
+        return [rect]
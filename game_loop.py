@@ -0,0 +1,63 @@
+import pygame
+
+
+class FixedTimestep:
+    """
+    Accumulator that turns variable frame times into a whole number of fixed logic steps.
+    At most max_steps are run per frame so a long stall can't trigger a spiral of catch-up work;
+    the time that is dropped is simply forgotten.
+    """
+
+    def __init__(self, step, max_steps=25):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.steps = 0  # Total logic steps handed out so far
+
+    def add(self, elapsed):
+        """
+        Add elapsed time (in the same unit as step) and return how many steps to run now.
+        """
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self):
+        """
+        How far (0..1) the current frame lies between the last logic step and the next one,
+        for interpolating what is drawn.
+        """
+        return self.accumulator / self.step
+
+
+class FrameScheduler:
+    """
+    Caps rendering at `fps` frames per second (sleeping in between instead of spinning)
+    and runs game logic on a fixed timestep of `step_ms` milliseconds.
+    """
+
+    def __init__(self, fps=60, step_ms=10, max_steps=25):
+        self.fps = fps
+        self.clock = pygame.time.Clock()
+        self.timestep = FixedTimestep(step_ms, max_steps)
+
+    @property
+    def step_ms(self):
+        return self.timestep.step
+
+    @property
+    def alpha(self):
+        return self.timestep.alpha
+
+    def wait(self):
+        """
+        Sleep until the next frame is due and return the number of logic steps to run.
+        """
+        return self.timestep.add(self.clock.tick(self.fps))
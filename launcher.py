@@ -0,0 +1,144 @@
+import time
+
+START = time.perf_counter()  # Taken before anything else, so imports are part of the measured start-up
+
+import argparse
+import os
+import re
+import runpy
+import sys
+
+# Game name -> module run as __main__
+games = {
+    'tetris': 'tetris',
+    'space': 'spaceshooting',
+    'ball': 'bouncingball',
+}
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'o3-mini-high-games')
+
+
+def prepare(cache_dir, plain=False):
+    """
+    Set up the process for a fast start before pygame is first imported.
+    """
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    if plain:
+        return
+    # pygame.pkgdata imports pkg_resources only to look for packaged resources, and falls
+    # back to plain files without it; the import alone is a large part of pygame's own.
+    # Block it for pygame's import only, so anything importing it later still can.
+    blocked = 'pkg_resources' not in sys.modules
+    if blocked:
+        sys.modules['pkg_resources'] = None
+    try:
+        import pygame  # Only imported here for the blocking above; the game imports it again
+    finally:
+        if blocked:
+            del sys.modules['pkg_resources']
+    import text_cache
+    text_cache.font_cache_file = os.path.join(cache_dir, 'fonts.json')
+
+
+def watch_first_frame(exit_after=False):
+    """
+    Report the time from launch to the first pygame.display.flip or update call on stderr,
+    and exit right after it if exit_after is set.
+    """
+    import pygame
+    originals = {name: getattr(pygame.display, name) for name in ('flip', 'update')}
+
+    def wrap(name):
+        def first_frame(*args):
+            result = originals[name](*args)
+            for restore, function in originals.items():
+                setattr(pygame.display, restore, function)
+            print("first frame %.1f ms after launch (%.0f epoch ms)" % (
+                (time.perf_counter() - START) * 1000, time.time() * 1000), file=sys.stderr, flush=True)
+            if exit_after:
+                pygame.quit()
+                os._exit(0)  # Skip interpreter teardown; it is not part of the start-up
+            return result
+        return first_frame
+
+    for name in originals:
+        setattr(pygame.display, name, wrap(name))
+
+
+def launch(game, game_args, cache_dir, plain=False, report=False, exit_after_first_frame=False):
+    """
+    Run a game's command line as if it had been started directly.
+    """
+    prepare(cache_dir, plain)
+    if report or exit_after_first_frame:
+        watch_first_frame(exit_after_first_frame)
+    sys.argv = [games[game] + '.py'] + list(game_args)
+    runpy.run_module(games[game], run_name='__main__', alter_sys=True)
+
+
+def parse_importtime(stderr):
+    """
+    Return (total ms, [(ms, module)] of the top-level imports, heaviest first) from the
+    output of python -X importtime.
+    """
+    top = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)', line)
+        if match and not match.group(3):
+            top.append((int(match.group(2)) / 1000, match.group(4)))
+    return sum(ms for ms, _ in top), sorted(top, reverse=True)
+
+
+def measure(names, runs, cache_dir, plain=False):
+    """
+    Start each game `runs` times in a fresh interpreter on SDL's dummy video driver and
+    print the median time to first frame, measured from process spawn, and the import
+    time reported by -X importtime with its heaviest top-level imports.
+    """
+    import subprocess  # Only needed here; kept out of the launch path
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy')
+    print("%-8s %14s %12s  %s" % ('game', 'first frame', 'imports', 'heaviest imports'))
+    for name in names:
+        first_frames, imports = [], []
+        for _ in range(runs):
+            command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--exit-after-first-frame',
+                       '--cache-dir', cache_dir] + (['--plain'] if plain else []) + [name]
+            spawned = time.time() * 1000
+            result = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            match = re.search(r'first frame [\d.]+ ms after launch \((\d+) epoch ms\)', result.stderr)
+            if match is None:
+                print("%-8s did not draw a frame:\n%s" % (name, result.stderr[-2000:]))
+                break
+            first_frames.append(int(match.group(1)) - spawned)
+            imports.append(parse_importtime(result.stderr))
+        if not first_frames:
+            continue
+        first_frames.sort()
+        imports.sort()
+        total, top = imports[len(imports) // 2]
+        heaviest = ", ".join("%s %.0f" % (module, ms) for ms, module in top[:4])
+        print("%-8s %11.0f ms %9.0f ms  %s" % (name, first_frames[len(first_frames) // 2], total, heaviest))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Start a game with only what its first frame needs",
+        epilog="Arguments after the game name are passed to the game, e.g. launcher.py tetris --bot")
+    parser.add_argument('game', nargs='?', choices=sorted(games))
+    parser.add_argument('game_args', nargs=argparse.REMAINDER)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="where resolved font paths are kept")
+    parser.add_argument('--plain', action='store_true', help="launch without the start-up shortcuts, for comparison")
+    parser.add_argument('--report', action='store_true', help="print the time to first frame")
+    parser.add_argument('--exit-after-first-frame', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--measure', nargs='*', metavar='GAME',
+                        help="time cold starts of the given games (default all) in fresh interpreters")
+    parser.add_argument('--runs', type=int, default=5, help="starts per game for --measure")
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        names = args.measure or ([args.game] if args.game else sorted(games))
+        measure(names, args.runs, args.cache_dir, args.plain)
+    elif args.game is None:
+        parser.error("name a game to launch, or use --measure")
+    else:
+        launch(args.game, args.game_args, args.cache_dir, args.plain, args.report, args.exit_after_first_frame)
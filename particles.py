@@ -0,0 +1,192 @@
+import collections
+
+import numpy as np
+import pygame
+
+
+class ParticleSystem:
+    """
+    Short-lived particles (sparks, debris) in preallocated NumPy arrays: position,
+    velocity, remaining and total lifetime in frames, and a colour from `palette`.
+    Emitting writes into a ring buffer, so when the pool is full the oldest particles are
+    overwritten instead of new ones being dropped, and nothing is ever allocated.
+    update moves the particles with a few whole-array operations, and draw writes all
+    live particles into the surface's pixel array in one indexed assignment.
+    Only the slots written by bursts that may still have live particles are touched, so
+    the cost follows the number of recent particles rather than the pool size.
+
+    Particles fade out over their lifetime in `shades` steps. Every palette colour at
+    every step is mapped to the surface's pixel format once, so drawing looks up one
+    ready-made pixel value per particle.
+    Particles are purely cosmetic and never feed back into the game state.
+    """
+
+    def __init__(self, capacity, palette, drag=0.95, shades=16, seed=None):
+        self.capacity = capacity
+        self.drag = drag
+        self.shades = shades
+        self.seed = seed
+        self.rng = None  # Created on the first emit: importing numpy.random is a noticeable part of start-up
+        self.pos = np.zeros((capacity, 2), dtype=np.float32)
+        self.vel = np.zeros((capacity, 2), dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.float32)  # Frames left; dead at 0 or below
+        self.lifetime = np.ones(capacity, dtype=np.float32)
+        self.color = np.zeros(capacity, dtype=np.intp)  # Index into palette
+        # RGB of palette colour c at fade step k (1 = faintest) is at row c * shades + k - 1
+        levels = np.arange(1, shades + 1) / shades
+        palette = np.asarray(palette, dtype=np.float64)
+        self.shade_rgb = (palette[:, None, :] * levels[None, :, None]).reshape(-1, 3).astype(np.uint8)
+        self.mapped = {}  # Pixel format -> shade_rgb mapped to that format
+        self.head = 0  # Next slot to write
+        self.bursts = collections.deque()  # [frames until all dead, particles] per emit, oldest first
+        self.recent = 0  # Particles emitted by the bursts in self.bursts
+        self.emitted = 0
+
+    def emit(self, centers, per_center, speed, lifetime, colors):
+        """
+        Emit a burst of `per_center` particles at each of the (n, 2) `centers`, flying off
+        in random directions at up to `speed` pixels per frame and living between
+        lifetime[0] and lifetime[1] frames. Each particle gets a random colour out of the
+        palette indices in `colors`.
+        """
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        if self.capacity == 0:
+            return
+        # A burst never wraps onto itself: keep the newest bursts that fit the pool
+        per_center = min(per_center, self.capacity)
+        n = len(centers) * per_center
+        if n == 0:
+            return
+        if n > self.capacity:
+            centers = centers[-max(1, self.capacity // per_center):]
+            n = len(centers) * per_center
+        if self.rng is None:
+            self.rng = np.random.default_rng(self.seed)
+        rng = self.rng
+        slots = (self.head + np.arange(n)) % self.capacity
+        angle = rng.uniform(0, 2 * np.pi, n)
+        # Square root so bursts fill a disc instead of bunching at the centre
+        magnitude = speed * np.sqrt(rng.uniform(0, 1, n))
+        self.pos[slots] = np.repeat(centers, per_center, axis=0)
+        self.vel[slots, 0] = np.cos(angle) * magnitude
+        self.vel[slots, 1] = np.sin(angle) * magnitude
+        life = rng.integers(lifetime[0], lifetime[1] + 1, n)
+        self.life[slots] = life
+        self.lifetime[slots] = life
+        self.color[slots] = np.asarray(colors)[rng.integers(0, len(colors), n)]
+        self.head = (self.head + n) % self.capacity
+        self.bursts.append([lifetime[1], n])
+        self.recent += n
+        self.emitted += n
+
+    def spans(self):
+        """
+        Return the slices of the arrays that may hold live particles.
+        """
+        # The recent bursts are the slots just before head, all of them once the ring wrapped
+        start = self.head - min(self.recent, self.capacity)
+        if start >= 0:
+            return [slice(start, self.head)]
+        return [slice(start + self.capacity, self.capacity), slice(0, self.head)]
+
+    @property
+    def frames_left(self):
+        """
+        Frames until every particle is dead.
+        """
+        return max((burst[0] for burst in self.bursts), default=0)
+
+    def update(self):
+        """
+        Advance every particle by one frame.
+        """
+        if not self.bursts:
+            return
+        for span in self.spans():
+            self.pos[span] += self.vel[span]
+            self.vel[span] *= self.drag
+            self.life[span] -= 1
+        for burst in self.bursts:
+            burst[0] -= 1
+        # Retire the oldest bursts once all their particles are dead
+        while self.bursts and self.bursts[0][0] <= 0:
+            self.recent -= self.bursts.popleft()[1]
+
+    def live(self):
+        """
+        Return the indices of the live particles.
+        """
+        if not self.bursts:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate([np.flatnonzero(self.life[span] > 0) + span.start for span in self.spans()])
+
+    def pixels(self, width, height):
+        """
+        Return the integer x and y coordinates of the live particles that fall inside a
+        width x height surface, and the row of each one's current shade in shade_rgb.
+        """
+        xs, ys, shades = [], [], []
+        for span in self.spans() if self.bursts else ():
+            life = self.life[span]
+            x = self.pos[span, 0].astype(np.intp)
+            y = self.pos[span, 1].astype(np.intp)
+            keep = (life > 0) & (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            life = life[keep]
+            # Fade step 1..shades, proportional to the lifetime left
+            step = np.ceil(life * self.shades / self.lifetime[span][keep]).astype(np.intp)
+            xs.append(x[keep])
+            ys.append(y[keep])
+            shades.append(self.color[span][keep] * self.shades + step - 1)
+        if not xs:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty, empty
+        return np.concatenate(xs), np.concatenate(ys), np.concatenate(shades)
+
+    def draw(self, surface):
+        """
+        Draw the live particles onto surface and return their x and y pixel coordinates,
+        which erase takes to remove them again.
+        """
+        xs, ys, shades = self.pixels(*surface.get_size())
+        if len(xs):
+            if surface.get_bytesize() == 3:
+                pixels = pygame.surfarray.pixels3d(surface)
+                pixels[xs, ys] = self.shade_rgb[shades]
+            else:
+                key = (surface.get_bitsize(), surface.get_masks())
+                if key not in self.mapped:
+                    self.mapped[key] = np.array([surface.map_rgb(rgb) for rgb in self.shade_rgb.tolist()], dtype=np.uint32)
+                pixels = pygame.surfarray.pixels2d(surface)
+                pixels[xs, ys] = self.mapped[key][shades]
+            del pixels  # Unlock the surface
+        return xs, ys
+
+    def stats(self):
+        """
+        Return pool statistics: live count, capacity and particles emitted so far.
+        """
+        return {'live': len(self.live()), 'capacity': self.capacity, 'emitted': self.emitted}
+
+
+def erase(surface, xs, ys, color=(0, 0, 0)):
+    """
+    Paint the pixels at xs, ys with color, undoing a ParticleSystem.draw.
+    """
+    if len(xs):
+        if surface.get_bytesize() == 3:
+            pixels = pygame.surfarray.pixels3d(surface)
+            pixels[xs, ys] = color
+        else:
+            pixels = pygame.surfarray.pixels2d(surface)
+            pixels[xs, ys] = surface.map_rgb(color)
+        del pixels
+
+
+def bounds(xs, ys):
+    """
+    Return the rect covering the pixels at xs, ys, or None if there are none.
+    """
+    if not len(xs):
+        return None
+    left, top = int(xs.min()), int(ys.min())
+    return pygame.Rect(left, top, int(xs.max()) - left + 1, int(ys.max()) - top + 1)
@@ -0,0 +1,79 @@
+import asyncio
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+# Helpers shared by the game servers (tetris_server, space_server): the real-time tick
+# loop, listening and connecting on TCP or a Unix socket, load-test statistics and
+# starting a server process for a load run.
+
+
+def percentiles(values):
+    """
+    Return the p50, p95 and p99 of values, or zeros if there are none.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0, 0.0, 0.0
+    return tuple(ordered[min(len(ordered) - 1, int(p * len(ordered)))] for p in (0.5, 0.95, 0.99))
+
+
+async def run_ticks(tick, rate):
+    """
+    Call tick() `rate` times per second in real time, catching up on ticks if the loop fell behind.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    ticks = 0
+    while True:
+        target = int((loop.time() - start) * rate)
+        while ticks < target:
+            tick()
+            ticks += 1
+        await asyncio.sleep(max(0.0, start + (target + 1) / rate - loop.time()))
+
+
+async def serve(handle, background, host, port, path=None):
+    """
+    Accept connections with handle on TCP or, given a path, a Unix socket, running the
+    `background` coroutines until the server stops.
+    """
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path=path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in background]
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def open_connection(host, port, path=None):
+    """
+    Connect over TCP or, given a path, a Unix socket and return (reader, writer).
+    """
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+@contextmanager
+def spawned(script, host, port, path=None, options=()):
+    """
+    Run `script serve` in its own process for the duration of the with block, after
+    giving it a second to start listening.
+    """
+    command = [sys.executable, script, 'serve', '--host', host, '--port', str(port)] + list(options)
+    if path is not None:
+        command += ['--unix', path]
+    server = subprocess.Popen(command)
+    time.sleep(1.0)
+    try:
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
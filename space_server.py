@@ -0,0 +1,548 @@
+import argparse
+import asyncio
+import collections
+import random
+import struct
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+import spaceshooting
+from server_common import open_connection, percentiles, run_ticks, serve, spawned
+from spaceshooting import (
+    BULLET_HEIGHT, FPS, HEIGHT, SHIP_HEIGHT, SHIP_WIDTH, SpaceShooter, bullet_speed, enemy_speed, steer,
+)
+
+# Wire protocol.
+# On connect the server sends HELLO with the player's ship id. Every frame the client
+# sends an INPUT: its input sequence number, the newest snapshot tick it has received
+# (the acknowledgement) and its buttons: bit 0 left, bit 1 right, bits 2-7 shots fired.
+# Every `send_every` ticks the server sends a SNAPSHOT, delta-encoded against the newest
+# snapshot the client acknowledged (or against nothing, if that is too old): the header,
+# then SHIP records for ships that changed, then new bullets and new enemies as ENTITY
+# records, then the ids of removed bullets and enemies as uint32.
+# Bullets and enemies move in a straight line at their class's speed and leave the game
+# exactly when they cross the screen edge, so the client works their positions out from
+# where they first appeared; only appearances and collisions are ever sent.
+HELLO = struct.Struct('<4sBBHI')  # magic, version, ship id, ticks per second, tick
+INPUT = struct.Struct('<IIB')  # input sequence, acknowledged snapshot tick, buttons
+SNAPSHOT = struct.Struct('<IIIIIB4H')  # tick, baseline tick, last input applied, score, tick time in us,
+# ships, new bullets, new enemies, removed bullets, removed enemies
+SHIP = struct.Struct('<BhB')  # ship id, x, state
+ENTITY = np.dtype([('id', '<u4'), ('x', '<i2'), ('y', '<i2')])
+MAGIC = b'SSRV'
+VERSION = 1
+NO_BASELINE = 0xFFFFFFFF
+
+# Ship states in SHIP records
+DEAD, ALIVE, GONE = 0, 1, 2
+
+SHIP_Y = HEIGHT - SHIP_HEIGHT - 10
+RESPAWN_TICKS = 2 * FPS
+HISTORY = 2 * FPS  # Snapshots kept as baselines; older acknowledgements get a full snapshot
+MAX_PLAYERS = 255
+MAX_QUEUED_INPUTS = 3  # Inputs buffered beyond this are applied at once to catch up
+
+# Per class: the store attribute, vertical speed, and whether a y position is still on screen
+classes = [
+    ('bullets', -bullet_speed, lambda y: y > -BULLET_HEIGHT),
+    ('enemies', enemy_speed, lambda y: y < HEIGHT),
+]
+
+
+def pack_buttons(inputs):
+    return (1 if inputs.left else 0) | (2 if inputs.right else 0) | min(inputs.fire, 63) << 2
+
+
+def unpack_buttons(buttons):
+    return spaceshooting.Inputs(bool(buttons & 1), bool(buttons & 2), buttons >> 2)
+
+
+class Player:
+    """
+    One connected ship and the inputs its client has sent but the server has not applied.
+    """
+
+    def __init__(self, ship_id, writer, x):
+        self.ship_id = ship_id
+        self.writer = writer
+        self.x = x
+        self.alive = True
+        self.respawn_at = None
+        self.inputs = collections.deque()
+        self.input_ack = 0  # Sequence number of the last input applied
+        self.acked = None  # Newest snapshot tick the client has received
+        self.bytes = 0
+
+
+class Arena:
+    """
+    The authoritative shared game: one SpaceShooter's bullets, enemies and enemy spawns,
+    with a ship per player instead of the single ship. Each tick applies every player's
+    next input, advances the world, resolves collisions and records the state as a
+    baseline for delta snapshots.
+    """
+
+    def __init__(self, seed=None, max_bullets=16384, max_enemies=4096):
+        self.game = SpaceShooter(seed, max_bullets=max_bullets, max_enemies=max_enemies, max_particles=0)
+        self.players = {}
+        self.tick = 0
+        self.score = 0
+        self.history = collections.OrderedDict()  # tick -> (ships, [(ids, ys) per class])
+
+    def join(self, writer):
+        ship_id = next(i for i in range(MAX_PLAYERS + 1) if i not in self.players)
+        if ship_id == MAX_PLAYERS:
+            return None
+        player = Player(ship_id, writer, self.game.ship_x)
+        self.players[ship_id] = player
+        return player
+
+    def leave(self, player):
+        self.players.pop(player.ship_id, None)
+
+    def step(self):
+        game = self.game
+        self.tick += 1
+        for player in self.players.values():
+            if not player.alive:
+                if self.tick >= player.respawn_at:
+                    player.alive = True
+                    player.x = game.ship_x
+                player.inputs.clear()
+                continue
+            # Normally one input per tick; a client that got ahead is caught up at once
+            while player.inputs:
+                seq, inputs = player.inputs.popleft()
+                for _ in range(inputs.fire):
+                    game.fire(player.x)
+                player.x = steer(player.x, inputs)
+                player.input_ack = seq
+                if len(player.inputs) <= MAX_QUEUED_INPUTS:
+                    break
+
+        game.frame += 1
+        game.advance(spawn_rolls=max(1, len(self.players)))
+        self.score += len(game.shoot_down())
+
+        # Test every ship against every enemy in one broadcast instead of a call per ship
+        alive = [player for player in self.players.values() if player.alive]
+        if alive and len(game.enemies):
+            boxes = game.enemies.boxes()
+            xs = np.array([player.x for player in alive])
+            hit = (
+                (boxes[:, 0, None] < xs + SHIP_WIDTH) & (xs < boxes[:, 2, None])
+                & (boxes[:, 1, None] < SHIP_Y + SHIP_HEIGHT) & (SHIP_Y < boxes[:, 3, None])
+            ).any(axis=0)
+            for player in np.array(alive, dtype=object)[hit]:
+                player.alive = False
+                player.respawn_at = self.tick + RESPAWN_TICKS
+
+        ships = {p.ship_id: (p.x, ALIVE if p.alive else DEAD) for p in self.players.values()}
+        stores = [getattr(game, name) for name, _, _ in classes]
+        self.history[self.tick] = (ships, [(s.ids[:len(s)].copy(), s.pos[:len(s), 1].astype(np.int64)) for s in stores])
+        while len(self.history) > HISTORY:
+            self.history.popitem(last=False)
+
+    def delta(self, baseline):
+        """
+        Encode the current state against the snapshot at tick `baseline` (None for a full
+        snapshot). Returns the counts for the SNAPSHOT header and the body.
+        """
+        ships, current = self.history[self.tick]
+        base = self.history.get(baseline)
+        if base is None:
+            base_ships, base_classes = {}, [(np.zeros(0, np.int64), np.zeros(0, np.int64))] * len(classes)
+        else:
+            base_ships, base_classes = base
+
+        ship_records = [SHIP.pack(i, x, state) for i, (x, state) in ships.items() if base_ships.get(i) != (x, state)]
+        ship_records += [SHIP.pack(i, 0, GONE) for i in base_ships if i not in ships]
+
+        added, removed = [], []
+        for (name, speed, on_screen), (ids, _), (base_ids, base_ys) in zip(classes, current, base_classes):
+            store = getattr(self.game, name)
+            n = len(store)
+            new = ~np.isin(ids, base_ids, assume_unique=True)
+            records = np.empty(int(new.sum()), ENTITY)
+            records['id'] = ids[new]
+            records['x'] = store.pos[:n, 0][new]
+            records['y'] = store.pos[:n, 1][new]
+            added.append(records)
+            # Entities that left the screen are dropped by the client on its own; only
+            # the ones destroyed in collisions need to be listed
+            gone = ~np.isin(base_ids, ids, assume_unique=True)
+            gone &= on_screen(base_ys + speed * (self.tick - baseline if base is not None else 0))
+            removed.append(base_ids[gone].astype('<u4'))
+
+        counts = (len(ship_records), len(added[0]), len(added[1]), len(removed[0]), len(removed[1]))
+        body = b''.join(ship_records) + b''.join(a.tobytes() for a in added) + b''.join(r.tobytes() for r in removed)
+        return counts, body
+
+
+class SpaceServer:
+    """
+    Runs one Arena at FPS ticks per second for every connected client and streams each
+    client delta snapshots against the last snapshot it acknowledged. Snapshots against
+    the same baseline are encoded once per tick and shared.
+    """
+
+    def __init__(self, seed=None, send_every=1, stats_every=5.0):
+        self.arena = Arena(seed)
+        self.send_every = send_every
+        self.stats_every = stats_every
+        self.tick_times = collections.deque(maxlen=10 * FPS)
+        self.last_tick_us = 0
+        self.bytes = 0
+
+    async def handle(self, reader, writer):
+        arena = self.arena
+        player = arena.join(writer)
+        if player is None:
+            writer.close()
+            return
+        writer.write(HELLO.pack(MAGIC, VERSION, player.ship_id, FPS, arena.tick))
+        try:
+            while True:
+                seq, acked, buttons = INPUT.unpack(await reader.readexactly(INPUT.size))
+                player.inputs.append((seq, unpack_buttons(buttons)))
+                if acked != NO_BASELINE:
+                    player.acked = acked
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            arena.leave(player)
+            writer.close()
+
+    def broadcast(self):
+        arena = self.arena
+        encoded = {}
+        for player in list(arena.players.values()):
+            writer = player.writer
+            if writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > 256 * 1024:
+                continue  # Slow client: skip it; its next snapshot is a delta from what it did get
+            baseline = player.acked if player.acked in arena.history else None
+            if baseline not in encoded:
+                encoded[baseline] = arena.delta(baseline)
+            counts, body = encoded[baseline]
+            header = SNAPSHOT.pack(
+                arena.tick, NO_BASELINE if baseline is None else baseline, player.input_ack, arena.score,
+                min(self.last_tick_us, 0xFFFFFFFF), *counts)
+            writer.write(header + body)
+            player.bytes += len(header) + len(body)
+            self.bytes += len(header) + len(body)
+
+    def tick(self):
+        """
+        Step the arena once, send the snapshots that are due and record the time taken.
+        """
+        began = time.perf_counter()
+        self.arena.step()
+        if self.arena.tick % self.send_every == 0:
+            self.broadcast()
+        elapsed = time.perf_counter() - began
+        self.tick_times.append(elapsed)
+        self.last_tick_us = int(elapsed * 1e6)
+
+    async def report(self):
+        """
+        Print players, live entities, tick time percentiles and outgoing bandwidth per client.
+        """
+        wall, sent = time.perf_counter(), self.bytes
+        while True:
+            await asyncio.sleep(self.stats_every)
+            now = time.perf_counter()
+            game = self.arena.game
+            players = len(self.arena.players)
+            p50, p95, p99 = percentiles(self.tick_times)
+            rate = (self.bytes - sent) / (now - wall)
+            print("players %d  bullets %d  enemies %d  tick p50 %.2f  p95 %.2f  p99 %.2f ms  %.1f KB/s per client" % (
+                players, len(game.bullets), len(game.enemies), p50 * 1000, p95 * 1000, p99 * 1000,
+                rate / max(players, 1) / 1000), flush=True)
+            wall, sent = now, self.bytes
+
+    async def serve(self, host='127.0.0.1', port=7778, path=None):
+        background = [run_ticks(self.tick, FPS)]
+        if self.stats_every:
+            background.append(self.report())
+        await serve(self.handle, background, host, port, path)
+
+
+class SpaceClient:
+    """
+    Rebuilds the arena from delta snapshots and predicts the player's own ship.
+    Each received snapshot is kept by tick, since the server encodes the next one against
+    whichever of them it knows the client has. Bullets and enemies are stored by where
+    they would have been at tick 0, so their position at any tick is one multiply-add.
+    Own-ship inputs are applied locally as they are sent; when a snapshot arrives the ship
+    is reset to the server's position and the inputs it has not applied yet are replayed.
+    """
+
+    def __init__(self):
+        empty = (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64))
+        self.states = {None: ({}, [empty] * len(classes))}  # tick -> (ships, [(ids, xs, y0s) per class])
+        self.tick = None
+        self.score = 0
+        self.server_tick_us = 0
+        self.seq = 0
+        self.pending = collections.deque()  # (seq, inputs) not yet applied by the server
+        self.predicted_x = None
+        self.correction = 0  # Distance the last snapshot moved the predicted ship
+        self.bytes = 0
+        self.snapshots = 0
+
+    async def connect(self, host='127.0.0.1', port=7778, path=None):
+        self.reader, self.writer = await open_connection(host, port, path)
+        magic, version, self.ship_id, self.tick_rate, _ = HELLO.unpack(await self.reader.readexactly(HELLO.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d space shooter server" % VERSION)
+        return self
+
+    @property
+    def ships(self):
+        return self.states[self.tick][0]
+
+    @property
+    def alive(self):
+        return self.ships.get(self.ship_id, (0, ALIVE))[1] == ALIVE
+
+    def send(self, inputs):
+        """
+        Send one frame of inputs, acknowledging the newest snapshot, and predict their effect.
+        """
+        self.seq += 1
+        if self.alive and self.predicted_x is not None:
+            self.pending.append((self.seq, inputs))
+            self.predicted_x = steer(self.predicted_x, inputs)
+        acked = NO_BASELINE if self.tick is None else self.tick
+        self.writer.write(INPUT.pack(self.seq, acked, pack_buttons(inputs)))
+
+    async def receive(self):
+        """
+        Wait for the next snapshot and apply it.
+        """
+        header = await self.reader.readexactly(SNAPSHOT.size)
+        tick, baseline, input_ack, self.score, self.server_tick_us, *counts = SNAPSHOT.unpack(header)
+        ship_count, new_bullets, new_enemies, removed_bullets, removed_enemies = counts
+        size = ship_count * SHIP.size + (new_bullets + new_enemies) * ENTITY.itemsize + (removed_bullets + removed_enemies) * 4
+        body = await self.reader.readexactly(size)
+        self.bytes += len(header) + len(body)
+        self.snapshots += 1
+
+        base_ships, base_classes = self.states[None if baseline == NO_BASELINE else baseline]
+        ships = dict(base_ships)
+        for i, x, state in SHIP.iter_unpack(body[:ship_count * SHIP.size]):
+            if state == GONE:
+                ships.pop(i, None)
+            else:
+                ships[i] = (x, state)
+
+        offset = ship_count * SHIP.size
+        added = []
+        for count in (new_bullets, new_enemies):
+            added.append(np.frombuffer(body, ENTITY, count, offset))
+            offset += count * ENTITY.itemsize
+        removed = []
+        for count in (removed_bullets, removed_enemies):
+            removed.append(np.frombuffer(body, '<u4', count, offset))
+            offset += count * 4
+
+        state = []
+        for (_, speed, on_screen), (ids, xs, y0s), new, gone in zip(classes, base_classes, added, removed):
+            keep = on_screen(y0s + speed * tick) & ~np.isin(ids, gone)
+            state.append((
+                np.concatenate((ids[keep], new['id'].astype(np.int64))),
+                np.concatenate((xs[keep], new['x'].astype(np.int64))),
+                np.concatenate((y0s[keep], new['y'].astype(np.int64) - speed * tick)),
+            ))
+        self.states[tick] = (ships, state)
+        self.tick = tick
+        # The server never encodes against a tick older than the baseline it just used,
+        # nor one that has dropped out of its history
+        oldest = tick - HISTORY if baseline == NO_BASELINE else max(baseline, tick - HISTORY)
+        for old in [t for t in self.states if t is not None and t < oldest]:
+            del self.states[old]
+
+        # Reconcile the predicted ship with the server's
+        while self.pending and self.pending[0][0] <= input_ack:
+            self.pending.popleft()
+        own = ships.get(self.ship_id)
+        if own is None or own[1] != ALIVE:
+            self.predicted_x = None
+            self.pending.clear()
+            return
+        predicted = self.predicted_x
+        x = own[0]
+        for _, inputs in self.pending:
+            x = steer(x, inputs)
+        self.predicted_x = x
+        self.correction = 0 if predicted is None else abs(x - predicted)
+
+    def positions(self, index):
+        """
+        Return the ids and (n, 2) positions of class `index` (0 bullets, 1 enemies) at the current tick.
+        """
+        ids, xs, y0s = self.states[self.tick][1][index]
+        return ids, np.column_stack((xs, y0s + classes[index][1] * self.tick))
+
+    def render(self, surface):
+        """
+        Draw the arena like SpaceShooter.render, with the own ship at its predicted position.
+        """
+        sprites = spaceshooting.sprite_cache()
+        surface.fill((0, 0, 0))
+        for i, (x, state) in self.ships.items():
+            if state == ALIVE:
+                if i == self.ship_id and self.predicted_x is not None:
+                    x = self.predicted_x
+                surface.blit(sprites['ship'], (x, SHIP_Y))
+        for index, name in enumerate(('bullet', 'enemy')):
+            _, positions = self.positions(index)
+            surface.blits(zip([sprites[name]] * len(positions), positions.tolist()), False)
+
+    def close(self):
+        self.writer.close()
+
+
+async def bot(address, stop, stats, rng):
+    """
+    One load-test player: sends autopilot inputs every frame and decodes every snapshot.
+    """
+    client = await SpaceClient().connect(**address)
+    loop = asyncio.get_running_loop()
+    offset = rng.randrange(1000)
+    stats['clients'].append(client)
+
+    async def sender():
+        frame = 0
+        next_time = loop.time()
+        while not stop.is_set():
+            client.send(spaceshooting.autopilot(frame + offset))
+            frame += 1
+            next_time += 1 / FPS
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+
+    task = asyncio.ensure_future(sender())
+    try:
+        while not stop.is_set():
+            receive = asyncio.ensure_future(client.receive())
+            done, _ = await asyncio.wait([receive, asyncio.ensure_future(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+            if receive not in done:
+                receive.cancel()
+                break
+            receive.result()
+            stats['tick_us'].append(client.server_tick_us)
+            stats['corrections'].append(client.correction)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        task.cancel()
+        client.close()
+
+
+async def load(address, stages, seconds, seed=None):
+    """
+    Grow the number of bot players in stages and print, for each stage, the entities in
+    play, bandwidth per client, snapshot rate, server tick time and prediction error.
+    """
+    rng = random.Random(seed)
+    stop = asyncio.Event()
+    stats = {'clients': [], 'tick_us': [], 'corrections': []}
+    tasks = []
+    print("%7s %8s %8s %12s %11s %24s %10s" % (
+        'players', 'bullets', 'enemies', 'KB/s/client', 'snaps/s', 'server tick p50/p95/p99', 'pred err'))
+    for players in stages:
+        while len(tasks) < players:
+            tasks.append(asyncio.ensure_future(bot(address, stop, stats, random.Random(rng.random()))))
+        await asyncio.sleep(1.0)  # Let the new players settle in
+        clients = list(stats['clients'])
+        before = [(c.bytes, c.snapshots) for c in clients]
+        stats['tick_us'].clear()
+        stats['corrections'].clear()
+        await asyncio.sleep(seconds)
+        received = [(c.bytes - b, c.snapshots - s) for c, (b, s) in zip(clients, before)]
+        p50, p95, p99 = percentiles(stats['tick_us'])
+        probe = clients[0]
+        bullets, enemies = (len(probe.positions(i)[0]) for i in range(2)) if probe.tick is not None else (0, 0)
+        print("%7d %8d %8d %12.2f %11.1f %10.2f/%.2f/%.2f ms %8.2fpx" % (
+            len(clients), bullets, enemies,
+            sum(b for b, _ in received) / len(received) / seconds / 1000,
+            sum(s for _, s in received) / len(received) / seconds,
+            p50 / 1000, p95 / 1000, p99 / 1000,
+            sum(stats['corrections']) / max(len(stats['corrections']), 1)), flush=True)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+
+def play(address):
+    """
+    Join a server in a window: arrow keys and space as in the single-player game.
+    """
+    import pygame
+
+    async def run():
+        client = await SpaceClient().connect(**address)
+        pygame.display.init()  # Fonts start on first use; no audio or joystick
+        screen = pygame.display.set_mode((spaceshooting.WIDTH, spaceshooting.HEIGHT))
+        pygame.display.set_caption("Space Shooter - ship %d" % client.ship_id)
+        reader = asyncio.ensure_future(receive_all(client))
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        try:
+            while not reader.done():
+                fire = 0
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                        fire += 1
+                keys = pygame.key.get_pressed()
+                client.send(spaceshooting.Inputs(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], fire))
+                if client.tick is not None:
+                    client.render(screen)
+                    pygame.display.flip()
+                next_time += 1 / FPS
+                await asyncio.sleep(max(0.0, next_time - loop.time()))
+        finally:
+            reader.cancel()
+            client.close()
+            pygame.quit()
+
+    async def receive_all(client):
+        try:
+            while True:
+                await client.receive()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Multiplayer space shooter over a socket")
+    parser.add_argument('mode', choices=['serve', 'play', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7778)
+    parser.add_argument('--unix', metavar='PATH', help="use a Unix socket instead of TCP")
+    parser.add_argument('--seed', type=int, help="seed for enemy spawns (serve) or bot inputs (load)")
+    parser.add_argument('--send-every', type=int, default=1, help="ticks between snapshots")
+    parser.add_argument('--stages', default='1,8,32,64', help="comma-separated player counts for load")
+    parser.add_argument('--seconds', type=float, default=5.0, help="duration of each load stage")
+    parser.add_argument('--spawn', action='store_true', help="with load, start a server process first")
+    args = parser.parse_args()
+    address = {'path': args.unix} if args.unix else {'host': args.host, 'port': args.port}
+
+    if args.mode == 'serve':
+        try:
+            asyncio.run(SpaceServer(args.seed, args.send_every).serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    elif args.mode == 'play':
+        play(address)
+    else:
+        options = ['--send-every', str(args.send_every)]
+        with spawned(__file__, args.host, args.port, args.unix, options) if args.spawn else nullcontext():
+            asyncio.run(load(address, [int(n) for n in args.stages.split(',')], args.seconds, args.seed))
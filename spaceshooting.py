@@ -1,128 +1,417 @@
-import pygame
+import argparse
 import random
+import time
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+import pygame
 
-# Initialize Pygame
-pygame.init()
+from entity_store import EntityStore, overlap_pairs
+from frame_profiler import FrameProfiler
+from particles import ParticleSystem, bounds, erase
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Space Shooter")
 
-# Clock for controlling frame rate
-clock = pygame.time.Clock()
+# Frame rate of the windowed game
 FPS = 60
 
 # Spaceship settings
 SHIP_WIDTH, SHIP_HEIGHT = 50, 40
-ship_x = WIDTH // 2 - SHIP_WIDTH // 2
-ship_y = HEIGHT - SHIP_HEIGHT - 10
 ship_speed = 5
 
 # Bullet settings
 BULLET_WIDTH, BULLET_HEIGHT = 5, 10
 bullet_speed = 7
-bullets = []  # List to keep track of bullets
 
 # Enemy settings
 ENEMY_WIDTH, ENEMY_HEIGHT = 40, 30
 enemy_speed = 2
-enemies = []  # List to keep track of enemies
 
-def spawn_enemy():
+# Pool sizes; bullets and enemies beyond these are not spawned
+MAX_BULLETS = 1024
+MAX_ENEMIES = 256
+
+# Particle effects: pool size, particles per hit and per ship explosion, and colours
+MAX_PARTICLES = 65536
+HIT_PARTICLES = 48
+SHIP_PARTICLES = 600
+particle_palette = [(255, 240, 180), (255, 190, 60), (255, 110, 30), (255, 40, 20), (200, 255, 200), (0, 255, 0), (0, 160, 0)]
+explosion_colors = [0, 1, 2, 3]  # Indices into particle_palette
+ship_colors = [4, 5, 6, 1]
+
+# Player input for one frame: held arrow keys and the number of spacebar presses
+Inputs = namedtuple('Inputs', ['left', 'right', 'fire'], defaults=[False, False, 0])
+
+
+def steer(ship_x, inputs):
     """
-    Spawns an enemy at a random horizontal position just above the screen.
+    Return a ship's new x position after one frame of inputs.
     """
-    x = random.randint(0, WIDTH - ENEMY_WIDTH)
-    y = -ENEMY_HEIGHT
-    return pygame.Rect(x, y, ENEMY_WIDTH, ENEMY_HEIGHT)
-
-# Main game loop
-running = True
-while running:
-    clock.tick(FPS)  # Maintain the game frame rate
-
-    # --- Event Handling ---
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    # Handle spaceship movement with arrow keys
+    if inputs.left:
+        ship_x = max(ship_x - ship_speed, 0)
+    if inputs.right:
+        ship_x = min(ship_x + ship_speed, WIDTH - SHIP_WIDTH)
+    return ship_x
 
-        # Shoot bullet when spacebar is pressed
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                # Create a new bullet positioned at the center-top of the spaceship
-                bullet_rect = pygame.Rect(
-                    ship_x + SHIP_WIDTH // 2 - BULLET_WIDTH // 2,
-                    ship_y,
-                    BULLET_WIDTH,
-                    BULLET_HEIGHT
-                )
-                bullets.append(bullet_rect)
 
-    # --- Update Game State ---
+class SpaceShooter:
+    """
+    The space shooter game, independent of any window.
+    update advances the simulation by one frame from an Inputs tuple and render draws
+    it onto a surface, so the game can run headless as fast as the CPU allows.
+    All randomness comes from the instance's own seeded RNG.
+    """
 
-    # Handle spaceship movement with arrow keys
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_LEFT]:
-        ship_x -= ship_speed
-        if ship_x < 0:
-            ship_x = 0
-    if keys[pygame.K_RIGHT]:
-        ship_x += ship_speed
-        if ship_x > WIDTH - SHIP_WIDTH:
-            ship_x = WIDTH - SHIP_WIDTH
-
-    # Update bullet positions (move them upward)
-    for bullet in bullets:
-        bullet.y -= bullet_speed
-    # Remove bullets that have gone off-screen
-    bullets = [b for b in bullets if b.y > -BULLET_HEIGHT]
-
-    # Randomly spawn new enemies (roughly 2 per second)
-    if random.randint(1, 30) == 1:
-        enemies.append(spawn_enemy())
-
-    # Update enemy positions (move them downward)
-    for enemy in enemies:
-        enemy.y += enemy_speed
-    # Remove enemies that have moved off-screen
-    enemies = [e for e in enemies if e.y < HEIGHT]
-
-    # --- Collision Detection ---
-
-    # Create a rectangle for the spaceship for collision detection
-    ship_rect = pygame.Rect(ship_x, ship_y, SHIP_WIDTH, SHIP_HEIGHT)
-
-    # Check for collisions between bullets and enemies
-    for bullet in bullets[:]:
-        for enemy in enemies[:]:
-            if bullet.colliderect(enemy):
-                bullets.remove(bullet)
-                enemies.remove(enemy)
-                break  # Exit inner loop once collision is detected
-
-    # Check if any enemy collides with the spaceship
-    for enemy in enemies:
-        if enemy.colliderect(ship_rect):
+    def __init__(self, seed=None, max_bullets=MAX_BULLETS, max_enemies=MAX_ENEMIES, max_particles=MAX_PARTICLES):
+        self.rng = random.Random(seed)
+        self.ship_x = WIDTH // 2 - SHIP_WIDTH // 2
+        self.ship_y = HEIGHT - SHIP_HEIGHT - 10
+        # Fixed-capacity pools: slots are recycled, so memory stays flat however long the game runs
+        self.bullets = EntityStore(max_bullets, fixed=True)
+        self.enemies = EntityStore(max_enemies, fixed=True)
+        # Cosmetic only, with its own RNG so effects never change the game's random sequence
+        self.particles = ParticleSystem(max_particles, particle_palette, seed=seed)
+        self.running = True
+        self.frame = 0
+
+    def spawn_enemy(self):
+        """
+        Spawns an enemy at a random horizontal position just above the screen.
+        Returns its slot, or None if the enemy pool is full.
+        """
+        x = self.rng.randint(0, WIDTH - ENEMY_WIDTH)
+        y = -ENEMY_HEIGHT
+        return self.enemies.spawn(x, y, ENEMY_WIDTH, ENEMY_HEIGHT, 0, enemy_speed)
+
+    def fire(self, ship_x=None):
+        """
+        Create a new bullet positioned at the center-top of the spaceship, or of a ship
+        at ship_x. Returns its slot, or None if the bullet pool is full.
+        """
+        if ship_x is None:
+            ship_x = self.ship_x
+        return self.bullets.spawn(
+            ship_x + SHIP_WIDTH // 2 - BULLET_WIDTH // 2,
+            self.ship_y,
+            BULLET_WIDTH,
+            BULLET_HEIGHT,
+            0,
+            -bullet_speed,
+        )
+
+    def update(self, inputs):
+        """
+        Advance the game by one frame. Returns False once the ship has been hit.
+        """
+        self.move(inputs)
+        return self.collide()
+
+    def move(self, inputs):
+        """
+        First half of update: handle the inputs, move everything and spawn enemies.
+        """
+        self.frame += 1
+
+        # Shoot bullets for spacebar presses
+        for _ in range(inputs.fire):
+            self.fire()
+
+        self.ship_x = steer(self.ship_x, inputs)
+        self.advance()
+
+    def advance(self, spawn_rolls=1):
+        """
+        Move bullets, enemies and particles one frame and roll `spawn_rolls` times for a
+        new enemy.
+        """
+        bullets, enemies = self.bullets, self.enemies
+
+        # Update bullet positions (move them upward)
+        bullets.move()
+        # Mark bullets that have gone off-screen
+        bullets.alive[:len(bullets)] &= bullets.pos[:len(bullets), 1] > -BULLET_HEIGHT
+
+        # Randomly spawn new enemies (roughly 2 per second per roll)
+        for _ in range(spawn_rolls):
+            if self.rng.randint(1, 30) == 1:
+                self.spawn_enemy()
+
+        # Update enemy positions (move them downward)
+        enemies.move()
+        # Mark enemies that have moved off-screen
+        enemies.alive[:len(enemies)] &= enemies.pos[:len(enemies), 1] < HEIGHT
+
+        self.particles.update()
+
+    def collide(self):
+        """
+        Second half of update: resolve collisions. Returns False once the ship has been hit.
+        """
+        # One burst per destroyed enemy, all emitted in a single call
+        centers = self.shoot_down()
+        if len(centers):
+            self.particles.emit(centers, HIT_PARTICLES, 4.0, (15, 40), explosion_colors)
+
+        if self.hits_ship(self.ship_x, self.ship_y):
+            if self.running:
+                self.particles.emit([(self.ship_x + SHIP_WIDTH / 2, self.ship_y + SHIP_HEIGHT / 2)],
+                                    SHIP_PARTICLES, 6.0, (30, 90), ship_colors)
+            self.running = False
+        return self.running
+
+    def shoot_down(self):
+        """
+        Destroy every bullet and enemy that collide, then free their slots.
+        Returns the centers of the destroyed enemies as an (n, 2) array.
+        """
+        bullets, enemies = self.bullets, self.enemies
+
+        # --- Collision Detection ---
+
+        # Check for collisions between bullets and enemies.
+        # A vectorized grid broad phase finds every overlapping pair; each live bullet then
+        # destroys the first live enemy (in spawn order) it touches.
+        hit_bullets, hit_enemies = overlap_pairs(bullets.boxes(), enemies.boxes())
+        destroyed = []
+        for i, j in zip(hit_bullets.tolist(), hit_enemies.tolist()):
+            if bullets.alive[i] and enemies.alive[j]:
+                bullets.alive[i] = enemies.alive[j] = False
+                destroyed.append(j)
+        centers = enemies.pos[destroyed] + (ENEMY_WIDTH / 2, ENEMY_HEIGHT / 2)
+
+        # Free the slots of everything that died this frame in one pass per pool
+        bullets.compact()
+        enemies.compact()
+        return centers
+
+    def hits_ship(self, ship_x, ship_y):
+        """
+        Return True if any enemy overlaps a ship at ship_x, ship_y.
+        """
+        boxes = self.enemies.boxes()
+        ship = (ship_x, ship_y, ship_x + SHIP_WIDTH, ship_y + SHIP_HEIGHT)
+        return bool(np.any(
+            (boxes[:, 0] < ship[2]) & (ship[0] < boxes[:, 2])
+            & (boxes[:, 1] < ship[3]) & (ship[1] < boxes[:, 3])
+        ))
+
+    def pool_stats(self):
+        """
+        Return the bullet and enemy pool statistics.
+        """
+        return {'bullets': self.bullets.stats(), 'enemies': self.enemies.stats(), 'particles': self.particles.stats()}
+
+    def render(self, surface):
+        """
+        Draw the current frame onto surface from scratch.
+        """
+        surface.fill((0, 0, 0))  # Fill the screen with black
+        sprites = sprite_cache()
+        surface.blit(sprites['ship'], (self.ship_x, self.ship_y))
+        surface.blits(zip(repeat(sprites['bullet']), self.bullets.pos[:len(self.bullets)].tolist()), False)
+        surface.blits(zip(repeat(sprites['enemy']), self.enemies.pos[:len(self.enemies)].tolist()), False)
+        self.particles.draw(surface)
+
+
+# Pre-rendered sprites and matching black patches used to erase them
+_sprites = {}
+
+
+def sprite_cache():
+    """
+    Return the ship, bullet and enemy sprites, creating them on first use.
+    """
+    if not _sprites:
+        for name, size, color in (
+            ('ship', (SHIP_WIDTH, SHIP_HEIGHT), (0, 255, 0)),
+            ('bullet', (BULLET_WIDTH, BULLET_HEIGHT), (255, 255, 255)),
+            ('enemy', (ENEMY_WIDTH, ENEMY_HEIGHT), (255, 0, 0)),
+        ):
+            sprite = pygame.Surface(size)
+            sprite.fill(color)
+            _sprites[name] = sprite
+            _sprites[name + '_erase'] = pygame.Surface(size)
+    return _sprites
+
+
+class SpriteRenderer:
+    """
+    Draws a SpaceShooter with one Surface.blits batch per entity class and one pixel
+    array write for the particles, which go on top.
+    Instead of clearing the whole screen it erases only last frame's sprites and particle
+    pixels, and draw returns the rects that changed for pygame.display.update. Past
+    `max_dirty` rects a single full-screen update is cheaper, so that is returned instead.
+    """
+
+    def __init__(self, surface, max_dirty=512):
+        self.surface = surface
+        self.max_dirty = max_dirty
+        self.sprites = sprite_cache()
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Force a full redraw on the next frame, e.g. after something else drew over the window.
+        """
+        self.previous = None
+        self.previous_particles = None
+
+    def _rects(self, game):
+        sprites = self.sprites
+        return [
+            (sprites['ship'], sprites['ship_erase'], [(game.ship_x, game.ship_y)]),
+            (sprites['bullet'], sprites['bullet_erase'], game.bullets.pos[:len(game.bullets)].tolist()),
+            (sprites['enemy'], sprites['enemy_erase'], game.enemies.pos[:len(game.enemies)].tolist()),
+        ]
+
+    def draw(self, game):
+        """
+        Bring the surface up to date with the game and return the dirty rects.
+        """
+        surface = self.surface
+        current = self._rects(game)
+        full = self.previous is None
+
+        if full:
+            surface.fill((0, 0, 0))
+        else:
+            for _, patch, positions in self.previous:
+                surface.blits(zip(repeat(patch), positions), False)
+            erase(surface, *self.previous_particles)
+
+        dirty = []
+        for sprite, _, positions in current:
+            dirty += surface.blits(zip(repeat(sprite), positions))
+        particles = game.particles.draw(surface)
+
+        if not full:
+            for sprite, _, positions in self.previous:
+                w, h = sprite.get_size()
+                dirty += [(x, y, w, h) for x, y in positions]
+            # Particles scatter, so each frame's are covered by one bounding rect
+            dirty += [rect for rect in (bounds(*particles), bounds(*self.previous_particles)) if rect]
+        self.previous = current
+        self.previous_particles = particles
+
+        if full or len(dirty) > self.max_dirty:
+            return [surface.get_rect()]
+        return dirty
+
+
+def autopilot(frame, fire_every=5):
+    """
+    Scripted inputs for headless runs: sweep the ship back and forth while firing.
+    """
+    sweeping_left = (frame // 120) % 2 == 1
+    return Inputs(sweeping_left, not sweeping_left, 1 if frame % fire_every == 0 else 0)
+
+
+def run_headless(frames, seed=None, inputs=autopilot, endless=False):
+    """
+    Simulate up to `frames` frames with no display and no frame cap.
+    `inputs` maps a frame number to an Inputs tuple. Unless `endless` is set the run
+    stops when the ship is hit. Returns the game.
+    """
+    game = SpaceShooter(seed)
+    for frame in range(frames):
+        if not game.update(inputs(frame)) and not endless:
+            break
+    return game
+
+
+def main(profiler=None):
+    """
+    Play the game in a window. A FrameProfiler, if given, times every phase of the loop.
+    """
+    if profiler is None:
+        profiler = FrameProfiler(enabled=False)
+    pygame.display.init()  # Fonts start on first use; no audio or joystick
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Space Shooter")
+
+    # Clock for controlling frame rate
+    clock = pygame.time.Clock()
+    game = SpaceShooter()
+    renderer = SpriteRenderer(screen)
+
+    # Main game loop
+    running = True
+    while running:
+        profiler.frame()
+        clock.tick(FPS)  # Maintain the game frame rate
+        profiler.lap('wait')
+
+        # --- Event Handling ---
+        fire = 0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+            # Shoot bullet when spacebar is pressed
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                fire += 1
+
+            if profiler.handle_event(event):
+                renderer.invalidate()
+        profiler.lap('events')
+
+        # --- Update Game State ---
+        keys = pygame.key.get_pressed()
+        game.move(Inputs(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], fire))
+        profiler.lap('update')
+        if not game.collide():
             print("Game Over!")
             running = False
+        profiler.lap('collide')
+
+        # --- Drawing ---
+        dirty = renderer.draw(game)
+        dirty += profiler.draw_overlay(screen)
+        profiler.lap('draw')
 
-    # --- Drawing ---
-    screen.fill((0, 0, 0))  # Fill the screen with black
+        # Update only the parts of the display that changed
+        pygame.display.update(dirty)
+        profiler.lap('flip')
 
-    # Draw the spaceship (green rectangle)
-    pygame.draw.rect(screen, (0, 255, 0), ship_rect)
+    # Let the ship's explosion play out before closing, unless the window was closed
+    while not game.running and game.particles.frames_left > 0:
+        clock.tick(FPS)
+        if any(event.type == pygame.QUIT for event in pygame.event.get()):
+            break
+        game.particles.update()
+        pygame.display.update(renderer.draw(game))
 
-    # Draw the bullets (white rectangles)
-    for bullet in bullets:
-        pygame.draw.rect(screen, (255, 255, 255), bullet)
+    # Quit Pygame
+    pygame.quit()
 
-    # Draw the enemies (red rectangles)
-    for enemy in enemies:
-        pygame.draw.rect(screen, (255, 0, 0), enemy)
 
-    # Update the display
-    pygame.display.flip()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Space Shooter")
+    parser.add_argument('--headless', action='store_true', help="simulate without a window or frame cap")
+    parser.add_argument('--frames', type=int, default=100000, help="frames to simulate in headless mode")
+    parser.add_argument('--seed', type=int, help="RNG seed for enemy spawns")
+    parser.add_argument('--endless', action='store_true', help="keep simulating after the ship is hit")
+    parser.add_argument('--profile', action='store_true', help="time each frame phase; F3 shows the overlay")
+    parser.add_argument('--trace', metavar='PATH', help="with --profile, write the frame timings to a .csv or .json file")
+    args = parser.parse_args()
 
-# Quit Pygame
-pygame.quit()
+    if args.headless:
+        start = time.perf_counter()
+        game = run_headless(args.frames, args.seed, endless=args.endless)
+        elapsed = time.perf_counter() - start
+        print("%d frames in %.2fs (%.0f frames/s), game over: %s" % (
+            game.frame, elapsed, game.frame / elapsed, not game.running))
+        for name, stats in game.pool_stats().items():
+            print("%s: %s" % (name, ", ".join("%s %d" % item for item in stats.items())))
+    else:
+        profiler = FrameProfiler(enabled=args.profile or args.trace is not None)
+        try:
+            main(profiler)
+        finally:
+            if profiler.enabled:
+                print("\n".join(profiler.report()))
+                if args.trace:
+                    profiler.dump(args.trace)
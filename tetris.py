@@ -1,8 +1,28 @@
+import argparse
+import os
+
 import pygame
-import random
 
-# Initialize pygame fonts
-pygame.font.init()
+import text_cache
+from frame_profiler import FrameProfiler
+from game_loop import FrameScheduler
+from tetris_replay import ReplayWriter
+from tetris_engine import (
+    S, Z, I, O, J, L, T, shapes, shape_colors, shape_tables, FULL_ROW, Piece,
+    compile_shape, create_grid, convert_shape_format, create_bitboard, grid_to_bitboard,
+    piece_fits, valid_space, check_lost, get_shape, clear_rows,
+    TetrisState, NOOP, LEFT, RIGHT, DOWN, ROTATE,
+)
+
+# Labels rendered while the menu waits for a key, so the first game frame doesn't pay for
+# font lookups and the menu itself only waits for the one label it shows
+startup_labels = [
+    ('Tetris', 40, (255, 255, 255)),
+    ('Next Shape', 30, (255, 255, 255)),
+    ('Score: 0', 20, (255, 255, 255)),
+    ('Press any key to begin', 60, (255, 255, 255), 'comicsans', True),
+    ('YOU LOST', 80, (255, 255, 255), 'comicsans', True),
+]
 
 # Global Variables for the game window and grid
 s_width = 800
@@ -14,201 +34,12 @@ block_size = 30
 top_left_x = (s_width - play_width) // 2
 top_left_y = s_height - play_height - 50
 
-# Define the shapes and their rotations
-S = [['.....',
-      '......',
-      '..00..',
-      '.00...',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..00.',
-      '...0.',
-      '.....']]
-
-Z = [['.....',
-      '.....',
-      '.00..',
-      '..00.',
-      '.....'],
-     ['.....',
-      '..0..',
-      '.00..',
-      '.0...',
-      '.....']]
-
-I = [['..0..',
-      '..0..',
-      '..0..',
-      '..0..',
-      '.....'],
-     ['.....',
-      '0000.',
-      '.....',
-      '.....',
-      '.....']]
-
-O = [['.....',
-      '.....',
-      '.00..',
-      '.00..',
-      '.....']]
-
-J = [['.....',
-      '.0...',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..00.',
-      '..0..',
-      '..0..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '...0.',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..0..',
-      '.00..',
-      '.....']]
-
-L = [['.....',
-      '...0.',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..0..',
-      '..00.',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '.0...',
-      '.....'],
-     ['.....',
-      '.00..',
-      '..0..',
-      '..0..',
-      '.....']]
-
-T = [['.....',
-      '..0..',
-      '.000.',
-      '.....',
-      '.....'],
-     ['.....',
-      '..0..',
-      '..00.',
-      '..0..',
-      '.....'],
-     ['.....',
-      '.....',
-      '.000.',
-      '..0..',
-      '.....'],
-     ['.....',
-      '..0..',
-      '.00..',
-      '..0..',
-      '.....']]
-
-shapes = [S, Z, I, O, J, L, T]
-# Colors for each shape in RGB format
-shape_colors = [
-    (0, 255, 0),    # S
-    (255, 0, 0),    # Z
-    (0, 255, 255),  # I
-    (255, 255, 0),  # O
-    (255, 165, 0),  # J (or L)
-    (0, 0, 255),    # L (or J)
-    (128, 0, 128)   # T
-]
-
-
-class Piece:
-    def __init__(self, x, y, shape):
-        self.x = x  # X position on grid (in blocks)
-        self.y = y  # Y position on grid (in blocks)
-        self.shape = shape
-        self.color = shape_colors[shapes.index(shape)]
-        self.rotation = 0  # Current rotation state (0, 1, 2, 3)
-
-
-def create_grid(locked_positions={}):
-    """
-    Create a grid of 20 rows and 10 columns.
-    locked_positions is a dictionary with keys as (x,y) positions that are already occupied.
-    """
-    grid = [[(0, 0, 0) for _ in range(10)] for _ in range(20)]
-
-    for i in range(len(grid)):
-        for j in range(len(grid[i])):
-            if (j, i) in locked_positions:
-                grid[i][j] = locked_positions[(j, i)]
-    return grid
-
-
-def convert_shape_format(piece):
-    """
-    Convert the piece's string format into positions on the grid.
-    The offset (-2, -4) centers the shape appropriately.
-    """
-    positions = []
-    format = piece.shape[piece.rotation % len(piece.shape)]
-
-    for i, line in enumerate(format):
-        row = list(line)
-        for j, column in enumerate(row):
-            if column == '0':
-                positions.append((piece.x + j - 2, piece.y + i - 4))
-    return positions
-
-
-def valid_space(piece, grid):
-    """
-    Check if the piece is in a valid position (inside the grid and not colliding with locked positions).
-    """
-    accepted_positions = [[(j, i) for j in range(10) if grid[i][j] == (0, 0, 0)] for i in range(20)]
-    accepted_positions = [j for sub in accepted_positions for j in sub]
-
-    formatted = convert_shape_format(piece)
-
-    for pos in formatted:
-        if pos not in accepted_positions:
-            if pos[1] > -1:
-                return False
-    return True
-
-
-def check_lost(positions):
-    """
-    Check if any of the locked positions are above the screen (loss condition).
-    """
-    for pos in positions:
-        x, y = pos
-        if y < 1:
-            return True
-    return False
-
-
-def get_shape():
-    """
-    Return a new random piece.
-    """
-    return Piece(5, 0, random.choice(shapes))
-
 
 def draw_text_middle(surface, text, size, color):
     """
     Draw text in the middle of the surface.
     """
-    font = pygame.font.SysFont('comicsans', size, bold=True)
-    label = font.render(text, 1, color)
+    label = text_cache.render(text, size, color, bold=True)
 
     surface.blit(
         label,
@@ -239,13 +70,11 @@ def draw_window(surface, grid, score=0):
     """
     surface.fill((0, 0, 0))
     # Title
-    font = pygame.font.SysFont('comicsans', 40)
-    label = font.render('Tetris', 1, (255, 255, 255))
+    label = text_cache.render('Tetris', 40, (255, 255, 255))
     surface.blit(label, (top_left_x + play_width / 2 - label.get_width() / 2, 30))
 
     # Score
-    font = pygame.font.SysFont('comicsans', 20)
-    label = font.render('Score: ' + str(score), 1, (255, 255, 255))
+    label = text_cache.render('Score: ' + str(score), 20, (255, 255, 255))
     sx = top_left_x + play_width + 50
     sy = top_left_y + play_height / 2 - 100
     surface.blit(label, (sx + 20, sy + 160))
@@ -269,8 +98,7 @@ def draw_next_shape(piece, surface):
     """
     Draw the next piece that will fall (preview) on the side.
     """
-    font = pygame.font.SysFont('comicsans', 30)
-    label = font.render('Next Shape', 1, (255, 255, 255))
+    label = text_cache.render('Next Shape', 30, (255, 255, 255))
     sx = top_left_x + play_width + 50
     sy = top_left_y + play_height / 2 - 100
     format = piece.shape[piece.rotation % len(piece.shape)]
@@ -289,144 +117,248 @@ def draw_next_shape(piece, surface):
     surface.blit(label, (sx + 10, sy - 30))
 
 
-def clear_rows(grid, locked):
+class TetrisRenderer:
+    """
+    Incremental renderer producing the same picture as draw_window + draw_next_shape.
+    The title, labels, border and grid lines are baked into a cached background once;
+    each frame only the cells, score and preview that changed are redrawn, and draw
+    returns their rects for pygame.display.update.
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.panel_x = top_left_x + play_width + 50
+        self.panel_y = top_left_y + play_height / 2 - 100
+        self.panel_rect = pygame.Rect(self.panel_x, self.panel_y, 6 * block_size, 5 * block_size)
+
+        # Border and grid lines drawn over the cells; black is transparent.
+        # The lines end one pixel past the play area, just like draw_grid's.
+        self.overlay = pygame.Surface((play_width + 1, play_height + 1))
+        self.overlay.set_colorkey((0, 0, 0))
+        pygame.draw.rect(self.overlay, (255, 0, 0), (0, 0, play_width, play_height), 4)
+        for i in range(20):
+            pygame.draw.line(self.overlay, (128, 128, 128), (0, i * block_size), (play_width, i * block_size))
+        for j in range(10):
+            pygame.draw.line(self.overlay, (128, 128, 128), (j * block_size, 0), (j * block_size, play_height))
+
+        self.background = pygame.Surface(surface.get_size())
+        label = text_cache.render('Tetris', 40, (255, 255, 255))
+        self.background.blit(label, (top_left_x + play_width / 2 - label.get_width() / 2, 30))
+        label = text_cache.render('Next Shape', 30, (255, 255, 255))
+        self.background.blit(label, (self.panel_x + 10, self.panel_y - 30))
+        self.background.blit(self.overlay, (top_left_x, top_left_y))
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Force a full redraw on the next frame, e.g. after something else drew over the window.
+        """
+        self.cells = None
+        self.score = None
+        self.score_rect = None
+        self.next_piece = None
+
+    def draw(self, grid, score, next_piece):
+        """
+        Bring the surface up to date and return the list of dirty rects.
+        """
+        surface = self.surface
+        dirty = []
+        if self.cells is None:
+            surface.blit(self.background, (0, 0))
+            self.cells = [[(0, 0, 0)] * 10 for _ in range(20)]
+            dirty.append(surface.get_rect())
+
+        for i, row in enumerate(grid):
+            last = self.cells[i]
+            if row == last:
+                continue
+            for j, color in enumerate(row):
+                if color != last[j]:
+                    rect = pygame.Rect(top_left_x + j * block_size, top_left_y + i * block_size, block_size, block_size)
+                    surface.fill(color, rect)
+                    surface.blit(self.overlay, rect, rect.move(-top_left_x, -top_left_y))
+                    dirty.append(rect)
+            self.cells[i] = row[:]
+
+        if score != self.score:
+            if self.score_rect is not None:
+                surface.blit(self.background, self.score_rect, self.score_rect)
+                dirty.append(self.score_rect)
+            label = text_cache.render('Score: ' + str(score), 20, (255, 255, 255))
+            self.score_rect = surface.blit(label, (self.panel_x + 20, self.panel_y + 160))
+            dirty.append(self.score_rect)
+            self.score = score
+
+        if next_piece is not self.next_piece:
+            surface.blit(self.background, self.panel_rect, self.panel_rect)
+            for x, y in next_piece.table[next_piece.rotation % len(next_piece.table)][0]:
+                surface.fill(
+                    next_piece.color,
+                    (self.panel_x + (x + 2) * block_size, self.panel_y + (y + 4) * block_size, block_size, block_size),
+                )
+            dirty.append(self.panel_rect)
+            self.next_piece = next_piece
+
+        return dirty
+
+
+# Keyboard bindings for the falling piece
+key_actions = {
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+    pygame.K_DOWN: DOWN,
+    pygame.K_UP: ROTATE,
+}
+
+
+def main(win, seed=None, bot=None, fps=60, record=None, profiler=None):
     """
-    Check if any rows are complete, remove them, and move the rows above down.
-    Returns the number of cleared rows.
+    Pygame frontend over TetrisState: feeds it key presses and fixed 10 ms logic steps
+    and draws the result at no more than `fps` frames per second.
+    When a TetrisBot is given it plays instead of the keyboard, one move per frame.
+    When `record` is a path the game is written there as a replay (see tetris_replay).
+    A FrameProfiler, if given, times every phase of the loop.
     """
-    inc = 0
-    for i in range(len(grid) - 1, -1, -1):
-        row = grid[i]
-        if (0, 0, 0) not in row:
-            inc += 1
-            ind = i
-            # Remove the blocks in this row from locked
-            for j in range(len(row)):
-                try:
-                    del locked[(j, i)]
-                except KeyError:
-                    continue
-    if inc > 0:
-        # Shift every locked block above the cleared row down by the number of cleared rows
-        for key in sorted(list(locked), key=lambda x: x[1], reverse=True):
-            x, y = key
-            if y < ind:
-                newKey = (x, y + inc)
-                locked[newKey] = locked.pop(key)
-    return inc
-
-
-def main(win):
-    locked_positions = {}
-    grid = create_grid(locked_positions)
-
-    change_piece = False
+    if profiler is None:
+        profiler = FrameProfiler(enabled=False)
+    profiler.pause()  # A profiler shared across games must not time the menu as a frame
+    state = TetrisState(seed)
+    renderer = TetrisRenderer(win)
+    scheduler = FrameScheduler(fps)
+    recorder = None
+    if record is not None:
+        recorder = ReplayWriter(record, state.seed, scheduler.step_ms, state.fall_speed)
     run = True
-    current_piece = get_shape()
-    next_piece = get_shape()
-    clock = pygame.time.Clock()
-    fall_time = 0
-    fall_speed = 0.27
-    level_time = 0
-    score = 0
+    planned_piece = None
+    plan = []
 
     while run:
-        grid = create_grid(locked_positions)
-        fall_time += clock.get_rawtime()
-        level_time += clock.get_rawtime()
-        clock.tick()
-
-        # Increase speed over time
-        if level_time / 1000 > 5:
-            level_time = 0
-            if fall_speed > 0.12:
-                fall_speed -= 0.005
-
-        # Handle piece falling
-        if fall_time / 1000 > fall_speed:
-            fall_time = 0
-            current_piece.y += 1
-            if not valid_space(current_piece, grid) and current_piece.y > 0:
-                current_piece.y -= 1
-                change_piece = True
+        profiler.frame()
+        steps = scheduler.wait()
+        profiler.lap('wait')
 
         # Event handling
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
+                if recorder is not None:
+                    recorder.close()
                 pygame.display.quit()
                 quit()
 
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT:
-                    current_piece.x -= 1
-                    if not valid_space(current_piece, grid):
-                        current_piece.x += 1
-                elif event.key == pygame.K_RIGHT:
-                    current_piece.x += 1
-                    if not valid_space(current_piece, grid):
-                        current_piece.x -= 1
-                elif event.key == pygame.K_DOWN:
-                    current_piece.y += 1
-                    if not valid_space(current_piece, grid):
-                        current_piece.y -= 1
-                elif event.key == pygame.K_UP:
-                    # Rotate the piece
-                    current_piece.rotation = (current_piece.rotation + 1) % len(current_piece.shape)
-                    if not valid_space(current_piece, grid):
-                        current_piece.rotation = (current_piece.rotation - 1) % len(current_piece.shape)
-
-        shape_pos = convert_shape_format(current_piece)
-
-        # Add piece to the grid for drawing
-        for i in range(len(shape_pos)):
-            x, y = shape_pos[i]
-            if y > -1:
-                grid[y][x] = current_piece.color
-
-        # When a piece hits the ground, lock it and get a new piece
-        if change_piece:
-            for pos in shape_pos:
-                p = (pos[0], pos[1])
-                locked_positions[p] = current_piece.color
-            current_piece = next_piece
-            next_piece = get_shape()
-            change_piece = False
-            score += clear_rows(grid, locked_positions) * 10
-
-        draw_window(win, grid, score)
-        draw_next_shape(next_piece, win)
-        pygame.display.update()
-
-        if check_lost(locked_positions):
+            if event.type == pygame.KEYDOWN and event.key in key_actions and bot is None:
+                state.apply(key_actions[event.key])
+                if recorder is not None:
+                    recorder.action(key_actions[event.key])
+
+            if profiler.handle_event(event):
+                renderer.invalidate()
+        profiler.lap('events')
+
+        if bot is not None:
+            if state.current_piece is not planned_piece:
+                planned_piece = state.current_piece
+                plan = bot.plan(state)
+            action = plan.pop(0) if plan else DOWN
+            state.apply(action)
+            if recorder is not None:
+                recorder.action(action)
+
+        # Gravity runs on accumulated logic steps; a landed piece locks and the next one spawns
+        state.settle()
+        for _ in range(steps):
+            state.advance(scheduler.step_ms)
+            state.settle()
+        if recorder is not None:
+            recorder.steps(steps)
+            recorder.end_frame()
+        profiler.lap('update')
+
+        # The overlay sits in the empty margin left of the play area
+        with state.view() as grid:
+            dirty = renderer.draw(grid, state.score, state.next_piece)
+        dirty += profiler.draw_overlay(win)
+        profiler.lap('draw')
+        pygame.display.update(dirty)
+        profiler.lap('flip')
+
+        if state.lost:
+            profiler.pause()
             draw_text_middle(win, "YOU LOST", 80, (255, 255, 255))
             pygame.display.update()
             pygame.time.delay(1500)
             run = False
 
+    if recorder is not None:
+        recorder.close()
 
-def main_menu(win):
+
+def draw_menu(win):
     """
-    Display the start menu.
+    Draw the start menu screen.
     """
+    win.fill((0, 0, 0))
+    draw_text_middle(win, "Press any key to begin", 60, (255, 255, 255))
+    pygame.display.update()
+
+
+def numbered_path(path, number):
+    """
+    Return path for the first game and path with -number before the extension for later ones.
+    """
+    if number == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return "%s-%d%s" % (root, number, ext)
+
+
+def main_menu(win, bot=None, fps=60, record=None, profiler=None):
+    """
+    Display the start menu. The menu never changes, so it sleeps until an event arrives.
+    With `record`, every game started from the menu is recorded to its own numbered file.
+    """
+    draw_menu(win)
+    text_cache.warm_up(startup_labels)
+    games = 0
     run = True
     while run:
-        win.fill((0, 0, 0))
-        draw_text_middle(win, "Press any key to begin", 60, (255, 255, 255))
-        pygame.display.update()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.display.quit()
-                quit()
-            if event.type == pygame.KEYDOWN:
-                main(win)
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            run = False
+            pygame.display.quit()
+            quit()
+        if event.type == pygame.KEYDOWN:
+            games += 1
+            path = None if record is None else numbered_path(record, games)
+            main(win, bot=bot, fps=fps, record=path, profiler=profiler)
+            draw_menu(win)
 
     pygame.quit()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tetris")
+    parser.add_argument('--bot', action='store_true', help="let the placement-search bot play")
+    parser.add_argument('--budget', type=float, default=0.05, help="bot thinking time per piece in seconds")
+    parser.add_argument('--fps', type=int, default=60, help="frame rate cap")
+    parser.add_argument('--record', metavar='PATH', help="record each game as a replay file: PATH, then PATH-2, PATH-3, ... (numbered before the extension)")
+    parser.add_argument('--profile', action='store_true', help="time each frame phase; F3 shows the overlay")
+    parser.add_argument('--trace', metavar='PATH', help="with --profile, write the frame timings to a .csv or .json file")
+    args = parser.parse_args()
+
     win = pygame.display.set_mode((s_width, s_height))
     pygame.display.set_caption("Tetris")
-    main_menu(win)
+    profiler = FrameProfiler(('wait', 'events', 'update', 'draw', 'flip'), enabled=args.profile or args.trace is not None)
+    try:
+        if args.bot:
+            from tetris_bot import TetrisBot
+            with TetrisBot(budget=args.budget) as bot:
+                main_menu(win, bot, args.fps, args.record, profiler)
+        else:
+            main_menu(win, fps=args.fps, record=args.record, profiler=profiler)
+    finally:
+        if profiler.enabled:
+            print("\n".join(profiler.report()))
+            if args.trace:
+                profiler.dump(args.trace)
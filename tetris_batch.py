@@ -0,0 +1,157 @@
+import numpy as np
+
+from tetris_engine import shapes, shape_tables, LEFT, RIGHT, DOWN, ROTATE
+
+# Board layout shared by every environment: each row is a uint32 bitmask where
+# column c lives in bit c + 2. Four empty rows sit above the play area so pieces
+# can poke out of the top (as in the single game), and solid floor rows sit below it
+# so every row a piece spans can be gathered without bounds checks.
+TOP = 4
+FLOOR = TOP + 20
+ROWS = FLOOR + 4
+CELL_BITS = np.uint32(((1 << 10) - 1) << 2)
+
+# Walls and floor as a per-row mask; rows above the play area have no walls,
+# matching valid_space, which never rejects blocks above the screen.
+WALLS = np.zeros(ROWS, dtype=np.uint32)
+WALLS[TOP:FLOOR] = ~CELL_BITS
+WALLS[FLOOR:] = np.uint32(0xFFFFFFFF)
+
+# Piece masks indexed by [shape, rotation, row]; row i of a piece at (x, y) lands
+# on padded board row y + i and its bits only need shifting left by x.
+NUM_ROTATIONS = np.array([len(table) for table in shape_tables], dtype=np.int64)
+PIECE_MASKS = np.zeros((len(shapes), 4, 5), dtype=np.uint32)
+for kind, table in enumerate(shape_tables):
+    for rotation in range(4):
+        cells, _ = table[rotation % len(table)]
+        for dx, dy in cells:
+            PIECE_MASKS[kind, rotation, dy + 4] |= np.uint32(1 << (dx + 2))
+
+ROW_OFFSETS = np.arange(5)
+
+
+class BatchTetris:
+    """
+    N Tetris boards stepped in lockstep with NumPy.
+    Each call to step applies one action per board followed by one gravity tick;
+    landed pieces lock, full rows clear and lost boards reset automatically.
+    """
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.env = np.arange(n)
+
+        self.board = np.zeros((n, ROWS), dtype=np.uint32)
+        self.kind = self.rng.integers(0, len(shapes), size=n)
+        self.next_kind = self.rng.integers(0, len(shapes), size=n)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.x = np.full(n, 5, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.last_scores = np.zeros(0, dtype=np.int64)
+        self.episodes = 0
+
+    def reset(self, mask=None):
+        """
+        Reset the boards selected by the boolean mask (all boards by default).
+        """
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        count = int(mask.sum())
+        self.board[mask] = 0
+        self.score[mask] = 0
+        self.kind[mask] = self.rng.integers(0, len(shapes), size=count)
+        self.next_kind[mask] = self.rng.integers(0, len(shapes), size=count)
+        self._spawn(mask)
+
+    def _spawn(self, mask):
+        self.rotation[mask] = 0
+        self.x[mask] = 5
+        self.y[mask] = 0
+
+    def _collides(self, env, kind, rotation, x, y):
+        rows = y[:, None] + ROW_OFFSETS
+        cells = self.board[env[:, None], rows] | WALLS[rows]
+        piece = PIECE_MASKS[kind, rotation] << np.maximum(x, 0).astype(np.uint32)[:, None]
+        return (cells & piece).any(axis=1) | (x < 0)
+
+    def step(self, actions):
+        """
+        Apply one action per board (NOOP, LEFT, RIGHT, DOWN or ROTATE) and one gravity tick.
+        Returns (cleared, done): rows cleared on each board and which boards were lost
+        (and have already been reset). Scores of finished games are in last_scores.
+        """
+        actions = np.asarray(actions)
+        env, kind = self.env, self.kind
+
+        # Player input: try the move and keep it only where the piece still fits
+        x = self.x + (actions == RIGHT) - (actions == LEFT)
+        y = self.y + (actions == DOWN)
+        rotation = np.where(actions == ROTATE, (self.rotation + 1) % NUM_ROTATIONS[kind], self.rotation)
+        ok = ~self._collides(env, kind, rotation, x, y)
+        self.x = np.where(ok, x, self.x)
+        self.y = np.where(ok, y, self.y)
+        self.rotation = np.where(ok, rotation, self.rotation)
+
+        # Gravity: pieces that cannot move down lock in place
+        landed = self._collides(env, kind, self.rotation, self.x, self.y + 1)
+        self.y += ~landed
+
+        cleared = np.zeros(self.n, dtype=np.int64)
+        done = np.zeros(self.n, dtype=bool)
+        self.last_scores = np.zeros(0, dtype=np.int64)
+        if landed.any():
+            cleared, done = self._lock(np.flatnonzero(landed))
+        return cleared, done
+
+    def _lock(self, env):
+        kind = self.kind[env]
+        rows = self.y[env, None] + ROW_OFFSETS
+        piece = PIECE_MASKS[kind, self.rotation[env]] << self.x[env].astype(np.uint32)[:, None]
+        self.board[env[:, None], rows] |= piece
+
+        # Clear full rows by moving them to the top of each board and emptying them
+        board = self.board[env, :FLOOR]
+        full = board == CELL_BITS
+        counts = full.sum(axis=1)
+        hit = counts > 0
+        if hit.any():
+            sub = board[hit]
+            order = np.argsort(~full[hit], axis=1, kind='stable')
+            sub = np.take_along_axis(sub, order, axis=1)
+            sub[np.arange(FLOOR) < counts[hit, None]] = 0
+            self.board[env[hit], :FLOOR] = sub
+
+        cleared = np.zeros(self.n, dtype=np.int64)
+        cleared[env] = counts
+        self.score[env] += counts * 10
+
+        # Spawn the next piece and reset boards with blocks in the top row
+        self.kind[env] = self.next_kind[env]
+        self.next_kind[env] = self.rng.integers(0, len(shapes), size=len(env))
+        spawned = np.zeros(self.n, dtype=bool)
+        spawned[env] = True
+        self._spawn(spawned)
+
+        done = np.zeros(self.n, dtype=bool)
+        done[env] = self.board[env, :TOP + 1].any(axis=1)
+        if done.any():
+            self.last_scores = self.score[done].copy()
+            self.episodes += int(done.sum())
+            self.reset(done)
+        return cleared, done
+
+    def observation(self, include_piece=True):
+        """
+        Return the boards as an (N, 20, 10) uint8 occupancy array,
+        optionally with the falling pieces drawn in.
+        """
+        board = self.board
+        if include_piece:
+            board = board.copy()
+            rows = self.y[:, None] + ROW_OFFSETS
+            piece = PIECE_MASKS[self.kind, self.rotation] << self.x.astype(np.uint32)[:, None]
+            board[self.env[:, None], rows] |= piece
+        bits = np.arange(10, dtype=np.uint32) + 2
+        return ((board[:, TOP:FLOOR, None] >> bits) & 1).astype(np.uint8)
@@ -0,0 +1,221 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from functools import lru_cache
+
+from tetris_engine import FULL_ROW, Piece, shapes, shape_tables, piece_fits, LEFT, RIGHT, ROTATE
+
+# Heuristic weights: (aggregate height, lines cleared, holes, bumpiness)
+DEFAULT_WEIGHTS = (-0.510066, 0.760666, -0.35663, -0.184483)
+
+# Score given to placements that lock blocks above the screen
+LOSING_SCORE = -1e9
+
+
+def drop_row(piece, board, rotation, x):
+    """
+    Return the row where the piece comes to rest when dropped at (rotation, x).
+    """
+    y = piece.y
+    while piece_fits(piece, board, x=x, y=y + 1, rotation=rotation):
+        y += 1
+    return y
+
+
+def placements(index, board):
+    """
+    Enumerate the reachable placements of a freshly spawned piece of shape `index`.
+    A placement is reachable if the piece can rotate at the spawn position, slide
+    sideways to its column and then fall straight down.
+    Returns a list of (rotation, x, y) tuples.
+    """
+    piece = Piece(5, 0, shapes[index])
+    result = []
+    for rotation, (cells, rows) in enumerate(piece.table):
+        if not piece_fits(piece, board, rotation=rotation):
+            break
+        # Blocks above the screen never collide, so keep the columns in range explicitly
+        left = -min(dx for dx, _ in cells)
+        right = 9 - max(dx for dx, _ in cells)
+        for step, end in ((-1, left - 1), (1, right + 1)):
+            x = piece.x if step < 0 else piece.x + 1
+            while x != end and piece_fits(piece, board, x=x, rotation=rotation):
+                result.append((rotation, x, drop_row(piece, board, rotation, x)))
+                x += step
+    return result
+
+
+def place(index, board, rotation, x, y):
+    """
+    Lock a piece of shape `index` at (rotation, x, y) on a bitboard tuple.
+    Returns (new_board, cleared_rows, lost).
+    """
+    rows = list(board)
+    lost = False
+    table = shape_tables[index]
+    for dy, lo, hi, mask in table[rotation % len(table)][1]:
+        row = y + dy
+        if row < 1:
+            lost = True
+        if row >= 0:
+            rows[row] |= mask << (x + lo)
+
+    kept = [row for row in rows if row != FULL_ROW]
+    cleared = len(rows) - len(kept)
+    return (0,) * cleared + tuple(kept), cleared, lost
+
+
+@lru_cache(maxsize=1 << 16)
+def evaluate(board, weights=DEFAULT_WEIGHTS):
+    """
+    Score a bitboard tuple by aggregate height, holes and bumpiness (higher is better).
+    Results are cached on the board itself, so repeated positions are free.
+    """
+    heights = [0] * 10
+    holes = 0
+    covered = 0
+    for i, row in enumerate(board):
+        new = row & ~covered
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = 20 - i
+            new ^= low
+        holes += (covered & ~row).bit_count()
+        covered |= row
+
+    bumpiness = sum(abs(heights[c] - heights[c + 1]) for c in range(9))
+    return weights[0] * sum(heights) + weights[2] * holes + weights[3] * bumpiness
+
+
+def score_placement(index, board, placement, weights=DEFAULT_WEIGHTS):
+    """
+    Score a single placement of shape `index` without lookahead.
+    """
+    new_board, cleared, lost = place(index, board, *placement)
+    if lost:
+        return LOSING_SCORE
+    return evaluate(new_board, weights) + weights[1] * cleared
+
+
+def score_with_preview(index, board, placement, next_index, weights=DEFAULT_WEIGHTS):
+    """
+    Score a placement of shape `index` by the best placement of the preview piece after it.
+    Runs in the worker processes.
+    """
+    new_board, cleared, lost = place(index, board, *placement)
+    if lost:
+        return LOSING_SCORE
+    best = LOSING_SCORE
+    for follow in placements(next_index, new_board):
+        best = max(best, score_placement(next_index, new_board, follow, weights))
+    return best + weights[1] * cleared
+
+
+def score_batch(index, board, batch, next_index, weights=DEFAULT_WEIGHTS):
+    """
+    Score a batch of placements with lookahead; one task per worker keeps IPC overhead low.
+    """
+    return [score_with_preview(index, board, c, next_index, weights) for c in batch]
+
+
+class TetrisBot:
+    """
+    Placement-search bot for TetrisState.
+    For every spawned piece it scores each reachable placement together with the best
+    follow-up for the preview piece, spreading the work over a process pool in small
+    chunks, best one-piece placements first. Lookahead and one-piece scores are on
+    different scales, so only lookahead scores are compared: among the best one-piece
+    placements whose lookahead all finished within `budget` seconds. If the very best one
+    did not finish, it is taken on its one-piece score. Chunks still running at the
+    deadline are waited for before the next search starts its clock, so they never eat
+    into its budget.
+    """
+
+    def __init__(self, workers=None, budget=0.05, weights=DEFAULT_WEIGHTS):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.budget = budget
+        self.weights = weights
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        self.stale = []  # Chunks from an earlier search that were already running at its deadline
+
+    def choose(self, state):
+        """
+        Return the best (rotation, x, y) placement for the state's current piece, or None.
+        """
+        if self.stale:
+            wait(self.stale)
+            self.stale = []
+        deadline = time.perf_counter() + self.budget
+        board = tuple(state.board)
+        index = state.current_piece.index
+        next_index = state.next_piece.index
+        candidates = placements(index, board)
+        if not candidates:
+            return None
+
+        # Search the best one-piece placements first, so a partial search covers the likely winners
+        scores = [score_placement(index, board, c, self.weights) for c in candidates]
+        order = sorted(range(len(candidates)), key=scores.__getitem__, reverse=True)
+        candidates = [candidates[i] for i in order]
+
+        lookahead = {}  # Candidate index -> lookahead score, for the ones that finished
+        if self.executor is None:
+            for i, c in enumerate(candidates):
+                if time.perf_counter() > deadline:
+                    break
+                lookahead[i] = score_with_preview(index, board, c, next_index, self.weights)
+        else:
+            # Several small chunks per worker, so a chunk still running at the deadline is short
+            size = max(1, -(-len(candidates) // (4 * self.workers)))
+            futures = {
+                self.executor.submit(
+                    score_batch, index, board, candidates[i:i + size], next_index, self.weights
+                ): i
+                for i in range(0, len(candidates), size)
+            }
+            done, not_done = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+            for future in done:
+                for k, score in enumerate(future.result()):
+                    lookahead[futures[future] + k] = score
+            # cancel only stops chunks that have not started
+            self.stale = [future for future in not_done if not future.cancel()]
+
+        # Chunks can finish out of order; compare only the unbroken run from the best
+        # one-piece placement, so a skipped candidate never loses to a worse finished one
+        finished = 0
+        while finished in lookahead:
+            finished += 1
+        if finished:
+            return candidates[max(range(finished), key=lookahead.__getitem__)]
+        return candidates[0]
+
+    def plan(self, state):
+        """
+        Return the list of actions that moves the current piece over its chosen placement.
+        The caller keeps pressing DOWN (or lets gravity work) once the list is exhausted.
+        """
+        choice = self.choose(state)
+        if choice is None:
+            return []
+        rotation, x, _ = choice
+        piece = state.current_piece
+        moves = [ROTATE] * ((rotation - piece.rotation) % len(piece.shape))
+        if x < piece.x:
+            moves += [LEFT] * (piece.x - x)
+        else:
+            moves += [RIGHT] * (x - piece.x)
+        return moves
+
+    def close(self):
+        self.stale = []
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,490 @@
+import random
+from contextlib import contextmanager
+
+# Define the shapes and their rotations
+S = [['.....',
+      '......',
+      '..00..',
+      '.00...',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..00.',
+      '...0.',
+      '.....']]
+
+Z = [['.....',
+      '.....',
+      '.00..',
+      '..00.',
+      '.....'],
+     ['.....',
+      '..0..',
+      '.00..',
+      '.0...',
+      '.....']]
+
+I = [['..0..',
+      '..0..',
+      '..0..',
+      '..0..',
+      '.....'],
+     ['.....',
+      '0000.',
+      '.....',
+      '.....',
+      '.....']]
+
+O = [['.....',
+      '.....',
+      '.00..',
+      '.00..',
+      '.....']]
+
+J = [['.....',
+      '.0...',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..00.',
+      '..0..',
+      '..0..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '...0.',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..0..',
+      '.00..',
+      '.....']]
+
+L = [['.....',
+      '...0.',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..0..',
+      '..00.',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '.0...',
+      '.....'],
+     ['.....',
+      '.00..',
+      '..0..',
+      '..0..',
+      '.....']]
+
+T = [['.....',
+      '..0..',
+      '.000.',
+      '.....',
+      '.....'],
+     ['.....',
+      '..0..',
+      '..00.',
+      '..0..',
+      '.....'],
+     ['.....',
+      '.....',
+      '.000.',
+      '..0..',
+      '.....'],
+     ['.....',
+      '..0..',
+      '.00..',
+      '..0..',
+      '.....']]
+
+shapes = [S, Z, I, O, J, L, T]
+# Colors for each shape in RGB format
+shape_colors = [
+    (0, 255, 0),    # S
+    (255, 0, 0),    # Z
+    (0, 255, 255),  # I
+    (255, 255, 0),  # O
+    (255, 165, 0),  # J (or L)
+    (0, 0, 255),    # L (or J)
+    (128, 0, 128)   # T
+]
+
+
+# Bitboard representation of the play field:
+# every row is an int whose bit j is set when column j is occupied.
+FULL_ROW = (1 << 10) - 1
+
+
+def compile_shape(shape):
+    """
+    Precompile every rotation of a shape template.
+    Returns a list (one entry per rotation) of (cells, rows) where cells are the
+    (dx, dy) offsets of the blocks relative to the piece position and rows is a
+    list of (dy, lo, hi, mask) tuples: mask holds the row's blocks shifted so that
+    bit 0 is column offset lo, and hi is the rightmost column offset.
+    """
+    compiled = []
+    for format in shape:
+        cells = []
+        for i, line in enumerate(format):
+            for j, column in enumerate(line):
+                if column == '0':
+                    cells.append((j - 2, i - 4))
+
+        rows = []
+        for dy in sorted(set(dy for _, dy in cells)):
+            xs = [dx for dx, y in cells if y == dy]
+            lo = min(xs)
+            mask = 0
+            for dx in xs:
+                mask |= 1 << (dx - lo)
+            rows.append((dy, lo, max(xs), mask))
+        compiled.append((cells, rows))
+    return compiled
+
+
+# Every rotation of every shape, compiled once at import time
+shape_tables = [compile_shape(shape) for shape in shapes]
+
+
+class Piece:
+    def __init__(self, x, y, shape):
+        self.x = x  # X position on grid (in blocks)
+        self.y = y  # Y position on grid (in blocks)
+        self.shape = shape
+        self.index = shapes.index(shape)
+        self.color = shape_colors[self.index]
+        self.rotation = 0  # Current rotation state (0, 1, 2, 3)
+        self.table = shape_tables[self.index]
+
+
+def create_grid(locked_positions=None):
+    """
+    Create a grid of 20 rows and 10 columns.
+    locked_positions is a dictionary with keys as (x,y) positions that are already occupied.
+    """
+    grid = [[(0, 0, 0) for _ in range(10)] for _ in range(20)]
+    if not locked_positions:
+        return grid
+
+    for i in range(len(grid)):
+        for j in range(len(grid[i])):
+            if (j, i) in locked_positions:
+                grid[i][j] = locked_positions[(j, i)]
+    return grid
+
+
+def convert_shape_format(piece):
+    """
+    Convert the piece's string format into positions on the grid.
+    The offset (-2, -4) centers the shape appropriately; it is baked into the
+    precompiled cell offsets.
+    """
+    cells = piece.table[piece.rotation % len(piece.table)][0]
+    x, y = piece.x, piece.y
+    return [(x + dx, y + dy) for dx, dy in cells]
+
+
+def create_bitboard(locked_positions):
+    """
+    Build a bitboard (a list of 20 row masks) from the locked positions.
+    """
+    board = [0] * 20
+    for (x, y) in locked_positions:
+        if 0 <= y < 20:
+            board[y] |= 1 << x
+    return board
+
+
+def grid_to_bitboard(grid):
+    """
+    Build a bitboard from a colour grid such as the one returned by create_grid.
+    """
+    board = []
+    for row in grid:
+        mask = 0
+        for j, color in enumerate(row):
+            if color != (0, 0, 0):
+                mask |= 1 << j
+        board.append(mask)
+    return board
+
+
+def piece_fits(piece, board, x=None, y=None, rotation=None):
+    """
+    Check if the piece fits on the bitboard, optionally at another position or rotation.
+    Blocks above the top of the play area never collide.
+    """
+    if x is None:
+        x = piece.x
+    if y is None:
+        y = piece.y
+    if rotation is None:
+        rotation = piece.rotation
+    rows = piece.table[rotation % len(piece.table)][1]
+
+    for dy, lo, hi, mask in rows:
+        row = y + dy
+        if row < 0:
+            continue
+        if row >= 20 or x + lo < 0 or x + hi > 9:
+            return False
+        if board[row] & (mask << (x + lo)):
+            return False
+    return True
+
+
+def valid_space(piece, grid):
+    """
+    Check if the piece is in a valid position (inside the grid and not colliding with locked positions).
+    grid may be a colour grid or, preferably, a bitboard from create_bitboard.
+    """
+    if grid and not isinstance(grid[0], int):
+        grid = grid_to_bitboard(grid)
+    return piece_fits(piece, grid)
+
+
+def check_lost(positions):
+    """
+    Check if any of the locked positions are above the screen (loss condition).
+    """
+    for pos in positions:
+        x, y = pos
+        if y < 1:
+            return True
+    return False
+
+
+def get_shape(rng=random):
+    """
+    Return a new random piece drawn from rng (the global random module by default).
+    """
+    return Piece(5, 0, rng.choice(shapes))
+
+
+def clear_rows(grid, locked):
+    """
+    Check if any rows are complete, remove them, and move the rows above down.
+    Returns the number of cleared rows.
+    """
+    full = [i for i, row in enumerate(grid) if (0, 0, 0) not in row]
+    if full:
+        shift_locked(locked, full)
+    return len(full)
+
+
+def shift_locked(locked, rows):
+    """
+    Remove the blocks in the given rows from locked in place and move every block above
+    them down by the number of removed rows below it.
+    """
+    moved = {}
+    for (x, y), color in locked.items():
+        if y in rows:
+            continue
+        moved[(x, y + sum(1 for row in rows if row > y))] = color
+    locked.clear()
+    locked.update(moved)
+
+
+class PlayField:
+    """
+    The locked blocks of a game, kept as a colour grid, a bitboard and per-row block
+    counts that are all updated in place when a piece locks or rows clear, instead of
+    being rebuilt every frame. A lock only touches the piece's rows, so the complete
+    rows are found from their counts without scanning the board.
+    """
+
+    def __init__(self, locked_positions=None):
+        self.locked = {}  # (x, y) -> colour, including blocks above the top of the screen
+        self.cells = [[(0, 0, 0)] * 10 for _ in range(20)]
+        self.rows = [0] * 20  # Bitboard
+        self.counts = [0] * 20
+        self.version = 0  # Bumped whenever blocks lock or rows clear
+        if locked_positions:
+            self.locked.update(locked_positions)
+            self._rebuild()
+
+    def _rebuild(self):
+        for y in range(20):
+            self.cells[y][:] = [(0, 0, 0)] * 10
+        self.rows[:] = [0] * 20
+        self.counts[:] = [0] * 20
+        for (x, y), color in self.locked.items():
+            if 0 <= y < 20:
+                self.cells[y][x] = color
+                self.rows[y] |= 1 << x
+                self.counts[y] += 1
+
+    def lock(self, piece):
+        """
+        Lock the piece in place and return the indices of the rows it completed.
+        """
+        self.version += 1
+        full = []
+        for x, y in convert_shape_format(piece):
+            self.locked[(x, y)] = piece.color
+            if 0 <= y < 20:
+                self.cells[y][x] = piece.color
+                self.rows[y] |= 1 << x
+                self.counts[y] += 1
+                if self.counts[y] == 10 and y not in full:
+                    full.append(y)
+        return sorted(full)
+
+    def clear(self, rows):
+        """
+        Remove the given rows and move the blocks above them down.
+        """
+        self.version += 1
+        shift_locked(self.locked, rows)
+        # Clears are rare; blocks that were above the screen may come into view, so rebuild
+        self._rebuild()
+
+    @contextmanager
+    def overlay(self, piece):
+        """
+        Temporarily draw the piece onto the colour grid and yield the grid, e.g. for a
+        renderer; the cells underneath are restored afterwards, so nothing is copied.
+        """
+        cells = self.cells
+        covered = []
+        for x, y in convert_shape_format(piece):
+            if y > -1:
+                covered.append((x, y, cells[y][x]))
+                cells[y][x] = piece.color
+        try:
+            yield cells
+        finally:
+            for x, y, color in reversed(covered):
+                cells[y][x] = color
+
+
+# Actions understood by TetrisState.apply / TetrisState.step
+NOOP, LEFT, RIGHT, DOWN, ROTATE = range(5)
+
+
+class TetrisState:
+    """
+    Headless, deterministic Tetris game.
+    Gravity is driven by explicit time steps (in milliseconds) passed to advance/step
+    instead of a wall clock, and every instance owns its own seeded RNG.
+    """
+
+    def __init__(self, seed=None, fall_speed=0.27):
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.field = PlayField()
+        self.locked_positions = self.field.locked
+        self.board = self.field.rows
+        self.current_piece = get_shape(self.rng)
+        self.next_piece = get_shape(self.rng)
+        self.change_piece = False
+        self.fall_time = 0
+        self.fall_speed = fall_speed
+        self.level_time = 0
+        self.score = 0
+        self.lost = False
+
+    def advance(self, dt):
+        """
+        Advance the game clock by dt milliseconds, applying gravity and speed-ups.
+        """
+        self.fall_time += dt
+        self.level_time += dt
+
+        # Increase speed over time
+        if self.level_time / 1000 > 5:
+            self.level_time = 0
+            if self.fall_speed > 0.12:
+                self.fall_speed -= 0.005
+
+        # Handle piece falling
+        if self.fall_time / 1000 > self.fall_speed:
+            self.fall_time = 0
+            piece = self.current_piece
+            piece.y += 1
+            if not piece_fits(piece, self.board) and piece.y > 0:
+                piece.y -= 1
+                self.change_piece = True
+
+    def apply(self, action):
+        """
+        Apply a player action to the falling piece. Returns True if the piece moved.
+        """
+        piece = self.current_piece
+        if action == LEFT:
+            moved = piece_fits(piece, self.board, x=piece.x - 1)
+            if moved:
+                piece.x -= 1
+        elif action == RIGHT:
+            moved = piece_fits(piece, self.board, x=piece.x + 1)
+            if moved:
+                piece.x += 1
+        elif action == DOWN:
+            moved = piece_fits(piece, self.board, y=piece.y + 1)
+            if moved:
+                piece.y += 1
+        elif action == ROTATE:
+            rotation = (piece.rotation + 1) % len(piece.shape)
+            moved = piece_fits(piece, self.board, rotation=rotation)
+            if moved:
+                piece.rotation = rotation
+        else:
+            moved = False
+        return moved
+
+    def settle(self):
+        """
+        Lock the falling piece if it has landed, clear complete rows and spawn the next piece.
+        Returns the number of cleared rows.
+        """
+        if not self.change_piece:
+            return 0
+
+        full = self.field.lock(self.current_piece)
+
+        self.current_piece = self.next_piece
+        self.next_piece = get_shape(self.rng)
+        self.change_piece = False
+
+        cleared = len(full)
+        if full:
+            self.field.clear(full)
+        self.score += cleared * 10
+        self.lost = check_lost(self.locked_positions)
+        return cleared
+
+    def step(self, action=NOOP, dt=0):
+        """
+        Advance the clock by dt milliseconds, apply one action and settle the piece.
+        Returns the number of cleared rows.
+        """
+        self.advance(dt)
+        self.apply(action)
+        return self.settle()
+
+    def grid(self):
+        """
+        Return a copy of the colour grid with the falling piece drawn on top.
+        Renderers can avoid the copy with `with state.view() as grid:`.
+        """
+        with self.view() as cells:
+            return [row[:] for row in cells]
+
+    def view(self):
+        """
+        Context manager yielding the play field's own colour grid with the falling piece
+        drawn on top; the grid must not be kept past the with block.
+        """
+        return self.field.overlay(self.current_piece)
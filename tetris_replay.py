@@ -0,0 +1,175 @@
+import argparse
+import queue
+import struct
+import threading
+
+from tetris_engine import TetrisState
+
+# File layout: a fixed header followed by a stream of one-byte events.
+# Bytes 0..127 are actions applied to the falling piece; bytes 128..255 advance the
+# game by 1..128 logic steps of step_ms each, so the step count timestamps every action.
+MAGIC = b'TRPL'
+VERSION = 2  # Version 1 games ran the old line clear, which mishandled non-adjacent rows
+HEADER = struct.Struct('<4sBQHd')  # magic, version, seed, step_ms, initial fall_speed
+MAX_STEPS = 128
+
+
+def encode_steps(n):
+    """
+    Encode a run of n logic steps as event bytes.
+    """
+    out = bytearray()
+    while n > 0:
+        chunk = min(n, MAX_STEPS)
+        out.append(127 + chunk)
+        n -= chunk
+    return bytes(out)
+
+
+class ReplayWriter:
+    """
+    Streams a game's events to disk from a background thread.
+    The game loop only appends to an in-memory buffer and hands it off once per frame,
+    so a slow disk never stalls a frame.
+    """
+
+    def __init__(self, path, seed, step_ms, fall_speed=0.27):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, step_ms, fall_speed))
+        self.buffer = bytearray()
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            self.file.write(chunk)
+            self.file.flush()
+        self.file.close()
+
+    def action(self, action):
+        self.buffer.append(action)
+
+    def steps(self, n):
+        self.buffer += encode_steps(n)
+
+    def end_frame(self):
+        """
+        Hand the events buffered during this frame to the writer thread.
+        """
+        if self.buffer:
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        self.end_frame()
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_replay(path):
+    """
+    Read a replay file. Returns (seed, step_ms, fall_speed, events).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, seed, step_ms, fall_speed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not a version %d Tetris replay" % (path, VERSION))
+    return seed, step_ms, fall_speed, data[HEADER.size:]
+
+
+def iter_events(events):
+    """
+    Yield ('action', action) and ('steps', n) pairs from raw event bytes.
+    """
+    for byte in events:
+        if byte < 128:
+            yield 'action', byte
+        else:
+            yield 'steps', byte - 127
+
+
+def replay_headless(path):
+    """
+    Re-run a recorded game at full speed without a display and return the final TetrisState.
+    """
+    seed, step_ms, fall_speed, events = read_replay(path)
+    state = TetrisState(seed, fall_speed)
+    for byte in events:
+        if byte < 128:
+            state.apply(byte)
+        else:
+            state.settle()
+            for _ in range(byte - 127):
+                state.advance(step_ms)
+                state.settle()
+        if state.lost:
+            break
+    return state
+
+
+def replay_realtime(path, win, fps=60):
+    """
+    Play a recorded game back at its original speed through the regular renderer.
+    Returns the final TetrisState.
+    """
+    import pygame
+    from game_loop import FrameScheduler
+    from tetris import TetrisRenderer
+
+    seed, step_ms, fall_speed, events = read_replay(path)
+    state = TetrisState(seed, fall_speed)
+    renderer = TetrisRenderer(win)
+    scheduler = FrameScheduler(fps, step_ms)
+    owed = 0
+
+    for kind, value in iter_events(events):
+        if kind == 'action':
+            state.apply(value)
+            continue
+        state.settle()
+        for _ in range(value):
+            while owed == 0:
+                with state.view() as grid:
+                    pygame.display.update(renderer.draw(grid, state.score, state.next_piece))
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return state
+                owed += scheduler.wait()
+            owed -= 1
+            state.advance(step_ms)
+            state.settle()
+        if state.lost:
+            break
+
+    with state.view() as grid:
+        pygame.display.update(renderer.draw(grid, state.score, state.next_piece))
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded Tetris game")
+    parser.add_argument('path')
+    parser.add_argument('--headless', action='store_true', help="replay at full speed and print the result")
+    args = parser.parse_args()
+
+    if args.headless:
+        state = replay_headless(args.path)
+    else:
+        import pygame
+        from tetris import s_width, s_height
+        win = pygame.display.set_mode((s_width, s_height))
+        pygame.display.set_caption("Tetris replay")
+        state = replay_realtime(args.path, win)
+        pygame.quit()
+    print("score", state.score, "locked blocks", len(state.locked_positions), "lost", state.lost)
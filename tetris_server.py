@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import collections
+import random
+import struct
+import time
+from contextlib import nullcontext
+
+from server_common import open_connection, percentiles, run_ticks, serve, spawned
+from tetris_engine import TetrisState, convert_shape_format, shape_colors
+
+# Wire protocol.
+# On connect the server sends HELLO. The client then sends one byte per action
+# (tetris_engine.NOOP..ROTATE, the same bytes as in replays). The server answers every
+# batch of actions it reads, and otherwise sends an update whenever gravity changes the
+# board: an UPDATE header followed by `rows` records of a row index and 10 cell codes,
+# one for each board row that differs from the last update sent.
+# Cell codes are 0 for empty and 1..7 for shape_colors[0..6].
+HELLO = struct.Struct('<4sBQH')  # magic, version, seed, step_ms
+UPDATE = struct.Struct('<IIIBBB')  # tick, actions acknowledged, score, next shape, flags, rows
+ROW = 11
+MAGIC = b'TSRV'
+VERSION = 1
+LOST = 1  # UPDATE flag: the game is over and the server closes the connection
+
+STEP_MS = 10  # Logic step, as in the desktop game
+MAX_ACTION = 4
+
+color_codes = {(0, 0, 0): 0}
+color_codes.update({color: i + 1 for i, color in enumerate(shape_colors)})
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel counting logic steps. Items scheduled for a tick land in slot
+    tick % slots; advancing one tick only looks at that slot, so the cost is independent
+    of how many items are waiting. Items due further ahead than `slots` ticks stay in
+    their slot until their round comes.
+    """
+
+    def __init__(self, slots=256):
+        self.slots = [[] for _ in range(slots)]
+        self.tick = 0
+
+    def schedule(self, tick, item):
+        """
+        Schedule item for a tick after the current one.
+        """
+        self.slots[tick % len(self.slots)].append((tick, item))
+
+    def advance(self):
+        """
+        Move to the next tick and return the items due on it.
+        """
+        self.tick += 1
+        slot = self.slots[self.tick % len(self.slots)]
+        if not slot:
+            return []
+        due = [item for tick, item in slot if tick == self.tick]
+        if len(due) == len(slot):
+            slot.clear()
+        else:
+            slot[:] = [(tick, item) for tick, item in slot if tick != self.tick]
+        return due
+
+
+def steps_until_change(state):
+    """
+    Return how many logic steps from now the next fall or speed-up happens; until then
+    gravity changes nothing, so the game need not be stepped.
+    """
+    fall, level = state.fall_time, state.level_time
+    n = 0
+    while True:
+        n += 1
+        fall += STEP_MS
+        level += STEP_MS
+        if level / 1000 > 5 or fall / 1000 > state.fall_speed:
+            return n
+
+
+class Session:
+    """
+    One client's game. Gravity is not polled: the session runs the logic steps it owes
+    whenever an action arrives or the timer wheel wakes it for its next fall.
+    """
+
+    def __init__(self, server, writer, seed):
+        self.server = server
+        self.writer = writer
+        self.state = TetrisState(seed)
+        self.tick = server.wheel.tick  # Logic steps run, on the wheel's clock
+        self.wake_at = None
+        self.acks = 0
+        self.sent = [bytes(10)] * 20  # Rows as the client last saw them
+        self.status = None
+        self.version = None
+        self.base = None  # The locked blocks' rows, encoded, for field version `version`
+        self.piece_rows = ()
+        writer.write(HELLO.pack(MAGIC, VERSION, seed, STEP_MS))
+
+    def catch_up(self):
+        """
+        Run the logic steps up to the wheel's current tick.
+        """
+        state = self.state
+        state.settle()
+        now = self.server.wheel.tick
+        while self.tick < now and not state.lost:
+            state.advance(STEP_MS)
+            state.settle()
+            self.tick += 1
+        self.tick = now
+
+    def schedule(self):
+        if self.state.lost:
+            return
+        wake_at = self.tick + steps_until_change(self.state)
+        if wake_at != self.wake_at:
+            self.wake_at = wake_at
+            self.server.wheel.schedule(wake_at, self)
+
+    def wake(self, tick):
+        if tick != self.wake_at or self.writer.is_closing():
+            return  # Superseded by a later schedule
+        self.catch_up()
+        self.send()
+        self.schedule()
+
+    def actions(self, data):
+        """
+        Apply a batch of action bytes from the client and acknowledge it.
+        """
+        self.catch_up()
+        state = self.state
+        for action in data:
+            if action <= MAX_ACTION and not state.lost:
+                state.apply(action)
+            self.acks += 1
+        self.send(force=True)
+        self.schedule()
+
+    def send(self, force=False):
+        """
+        Send the rows that changed since the last update. Without `force` nothing is sent
+        if nothing changed.
+        """
+        state = self.state
+        field = state.field
+        if field.version != self.version:
+            # Blocks locked or rows cleared: re-encode the whole field
+            self.base = [bytes([color_codes[color] for color in row]) for row in field.cells]
+            self.version = field.version
+            candidates = set(range(20))
+        else:
+            candidates = set(self.piece_rows)
+
+        # Overlay the falling piece on copies of the rows it covers
+        piece = state.current_piece
+        code = piece.index + 1
+        rows = {}
+        for x, y in convert_shape_format(piece):
+            if y >= 0:
+                if y not in rows:
+                    rows[y] = bytearray(self.base[y])
+                rows[y][x] = code
+        self.piece_rows = tuple(rows)
+        candidates.update(rows)
+
+        changed = []
+        for y in sorted(candidates):
+            row = bytes(rows[y]) if y in rows else self.base[y]
+            if row != self.sent[y]:
+                self.sent[y] = row
+                changed.append(bytes([y]) + row)
+
+        status = (state.score, state.next_piece.index, LOST if state.lost else 0)
+        if not changed and not force and status == self.status:
+            return
+        self.status = status
+        self.writer.write(UPDATE.pack(self.tick, self.acks, *status, len(changed)) + b''.join(changed))
+        self.server.updates += 1
+        if state.lost:
+            self.writer.close()
+
+
+class TetrisServer:
+    """
+    Hosts any number of headless games in one process, one Session per connection,
+    all driven by a single timer wheel ticking every STEP_MS.
+    """
+
+    def __init__(self, seed=None, stats_every=5.0):
+        self.rng = random.Random(seed)
+        self.wheel = TimerWheel()
+        self.sessions = set()
+        self.updates = 0
+        self.stats_every = stats_every
+
+    async def handle(self, reader, writer):
+        session = Session(self, writer, self.rng.randrange(1 << 63))
+        self.sessions.add(session)
+        session.send(force=True)
+        session.schedule()
+        try:
+            while not writer.is_closing():
+                data = await reader.read(4096)
+                if not data:
+                    break
+                session.actions(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            session.wake_at = None
+            writer.close()
+
+    def tick(self):
+        """
+        Advance the wheel one logic step and wake the sessions due on it.
+        """
+        for session in self.wheel.advance():
+            session.wake(self.wheel.tick)
+
+    async def report(self):
+        """
+        Print load statistics: sessions, updates per second and CPU use, from which
+        sessions per core follow.
+        """
+        wall, cpu, updates = time.perf_counter(), time.process_time(), self.updates
+        while True:
+            await asyncio.sleep(self.stats_every)
+            now_wall, now_cpu = time.perf_counter(), time.process_time()
+            busy = (now_cpu - cpu) / (now_wall - wall)
+            rate = (self.updates - updates) / (now_wall - wall)
+            per_core = len(self.sessions) / busy if busy > 0 else 0
+            print("sessions %d  updates/s %.0f  cpu %.1f%%  ~%.0f sessions/core" % (
+                len(self.sessions), rate, busy * 100, per_core), flush=True)
+            wall, cpu, updates = now_wall, now_cpu, self.updates
+
+    async def serve(self, host='127.0.0.1', port=7777, path=None):
+        background = [run_ticks(self.tick, 1000 / STEP_MS)]
+        if self.stats_every:
+            background.append(self.report())
+        await serve(self.handle, background, host, port, path)
+
+
+class TetrisClient:
+    """
+    Minimal client: sends actions and keeps a copy of the board from the row diffs.
+    """
+
+    def __init__(self):
+        self.rows = [bytes(10)] * 20
+        self.tick = self.acks = self.score = self.next_shape = 0
+        self.lost = False
+        self.bytes = 0
+
+    async def connect(self, host='127.0.0.1', port=7777, path=None):
+        self.reader, self.writer = await open_connection(host, port, path)
+        magic, version, self.seed, self.step_ms = HELLO.unpack(await self.reader.readexactly(HELLO.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d Tetris server" % VERSION)
+        return self
+
+    def send(self, actions):
+        self.writer.write(bytes(actions))
+
+    async def receive(self):
+        """
+        Wait for the next update and apply it. Returns the indices of the rows that changed.
+        """
+        header = await self.reader.readexactly(UPDATE.size)
+        self.tick, self.acks, self.score, self.next_shape, flags, count = UPDATE.unpack(header)
+        body = await self.reader.readexactly(count * ROW)
+        changed = []
+        for k in range(count):
+            record = body[k * ROW:(k + 1) * ROW]
+            self.rows[record[0]] = record[1:]
+            changed.append(record[0])
+        self.lost = bool(flags & LOST)
+        self.bytes += len(header) + len(body)
+        return changed
+
+    def board_text(self):
+        return "\n".join("".join(str(cell) if cell else '.' for cell in row) for row in self.rows)
+
+    def close(self):
+        self.writer.close()
+
+
+async def play(address, actions_per_second, deadline, stats, rng):
+    """
+    One load-generator player: connects, sends random actions at the given rate and
+    measures the time from sending each action to the update acknowledging it.
+    Starts a new game whenever one is lost, until the deadline.
+    """
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        client = await TetrisClient().connect(**address)
+        sent = collections.deque()  # Send times of unacknowledged actions
+        count = 0
+
+        async def sender():
+            nonlocal count
+            while loop.time() < deadline:
+                await asyncio.sleep(rng.expovariate(actions_per_second))
+                sent.append(loop.time())
+                count += 1
+                client.send([rng.randrange(MAX_ACTION + 1)])
+
+        task = asyncio.ensure_future(sender())
+        try:
+            while loop.time() < deadline and not client.lost:
+                try:
+                    await asyncio.wait_for(client.receive(), deadline - loop.time())
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                stats['updates'] += 1
+                now = loop.time()
+                acked = client.acks - (count - len(sent))
+                for _ in range(min(acked, len(sent))):
+                    stats['latencies'].append(now - sent.popleft())
+        finally:
+            task.cancel()
+            stats['bytes'] += client.bytes
+            stats['games'] += 1
+            client.close()
+
+
+async def load(address, sessions, actions_per_second, seconds, seed=None):
+    rng = random.Random(seed)
+    stats = {'updates': 0, 'bytes': 0, 'games': 0, 'latencies': []}
+    deadline = asyncio.get_running_loop().time() + seconds
+    await asyncio.gather(*[
+        play(address, actions_per_second, deadline, stats, random.Random(rng.random())) for _ in range(sessions)
+    ])
+    p50, p95, p99 = percentiles(stats['latencies'])
+    print("%d sessions, %d games, %.0f updates/s, %.1f KB/s, %d actions" % (
+        sessions, stats['games'], stats['updates'] / seconds, stats['bytes'] / seconds / 1000, len(stats['latencies'])))
+    print("input-to-update latency: p50 %.2f  p95 %.2f  p99 %.2f ms" % (p50 * 1000, p95 * 1000, p99 * 1000))
+
+
+async def watch(address, actions_per_second, seed=None):
+    """
+    Client stand-in: plays random moves and prints the board after every update.
+    """
+    rng = random.Random(seed)
+    client = await TetrisClient().connect(**address)
+
+    async def send_moves():
+        while True:
+            client.send([rng.randrange(MAX_ACTION + 1)])
+            await asyncio.sleep(1 / actions_per_second)
+
+    # Moves go out from their own task so a read is never cancelled halfway through an update
+    sender = asyncio.ensure_future(send_moves())
+    try:
+        while not client.lost:
+            await client.receive()
+            print("\x1b[H\x1b[2J" + client.board_text())
+            print("score %d  next %d  tick %d  %d bytes received" % (client.score, client.next_shape, client.tick, client.bytes))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        sender.cancel()
+    client.close()
+    print("game over, score", client.score)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Host many headless Tetris games over a socket")
+    parser.add_argument('mode', choices=['serve', 'client', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--unix', metavar='PATH', help="use a Unix socket instead of TCP")
+    parser.add_argument('--seed', type=int, help="seed for game seeds (serve) or random moves (client, load)")
+    parser.add_argument('--sessions', type=int, default=200, help="concurrent games for load")
+    parser.add_argument('--rate', type=float, default=5.0, help="actions per second per client")
+    parser.add_argument('--seconds', type=float, default=10.0, help="duration of a load run")
+    parser.add_argument('--spawn', action='store_true', help="with load, start a server process first")
+    args = parser.parse_args()
+    address = {'path': args.unix} if args.unix else {'host': args.host, 'port': args.port}
+
+    if args.mode == 'serve':
+        try:
+            asyncio.run(TetrisServer(args.seed).serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+    elif args.mode == 'client':
+        asyncio.run(watch(address, args.rate, args.seed))
+    else:
+        with spawned(__file__, args.host, args.port, args.unix) if args.spawn else nullcontext():
+            asyncio.run(load(address, args.sessions, args.rate, args.seconds, args.seed))
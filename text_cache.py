@@ -0,0 +1,92 @@
+import json
+import os
+from collections import OrderedDict
+
+import pygame
+
+# Resolved fonts keyed by (name, size, bold); SysFont lookups are slow, so each happens once
+fonts = {}
+
+# Optional JSON file remembering which font file each (name, bold) resolved to, so later
+# runs skip pygame's system font scan altogether. Set by the launcher.
+font_cache_file = None
+font_paths = None  # (name, bold) -> (path or None for the default font, whether to fake bold)
+
+# Rendered labels keyed by (text, size, color, name, bold), least recently used first
+labels = OrderedDict()
+max_labels = 256
+
+
+def get_font(size, name='comicsans', bold=False):
+    """
+    Return a cached pygame font, initialising the font module on first use.
+    """
+    key = (name, size, bold)
+    font = fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        path, fake_bold = resolve_font(name, bold)
+        # The same construction SysFont ends with
+        font = fonts[key] = pygame.font.Font(path, size)
+        if fake_bold:
+            font.set_bold(True)
+    return font
+
+
+def resolve_font(name, bold):
+    """
+    Return the font file SysFont picks for name and whether it fakes bold, from the font
+    cache file if there is one, else by letting SysFont scan the system fonts.
+    """
+    global font_paths
+    if font_paths is None:
+        font_paths = {}
+        if font_cache_file is not None and os.path.exists(font_cache_file):
+            try:
+                with open(font_cache_file) as f:
+                    font_paths = {(entry['name'], entry['bold']): (entry['path'], entry['fake_bold']) for entry in json.load(f)}
+            except (OSError, ValueError, KeyError, TypeError):
+                font_paths = {}  # Unreadable cache: rebuild it
+    cached = font_paths.get((name, bold))
+    if cached is not None and (cached[0] is None or os.path.exists(cached[0])):
+        return cached
+
+    # SysFont hands its choice to the constructor; capture it instead of building a font
+    resolved = pygame.font.SysFont(name, 0, bold=bold, constructor=lambda path, size, fake_bold, fake_italic: (path, fake_bold))
+    font_paths[(name, bold)] = resolved
+    if font_cache_file is not None:
+        entries = [{'name': n, 'bold': b, 'path': path, 'fake_bold': fake} for (n, b), (path, fake) in font_paths.items()]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(font_cache_file)), exist_ok=True)
+            with open(font_cache_file + '.tmp', 'w') as f:
+                json.dump(entries, f)
+            os.replace(font_cache_file + '.tmp', font_cache_file)
+        except OSError:
+            pass  # A read-only cache only costs the scan next time
+    return resolved
+
+
+def render(text, size, color, name='comicsans', bold=False):
+    """
+    Return a rendered label surface, re-rendering only text that is not in the cache.
+    The returned surface is shared and must not be drawn on.
+    """
+    key = (text, size, color, name, bold)
+    label = labels.get(key)
+    if label is None:
+        label = labels[key] = get_font(size, name, bold).render(text, 1, color)
+        if len(labels) > max_labels:
+            labels.popitem(last=False)
+    else:
+        labels.move_to_end(key)
+    return label
+
+
+def warm_up(specs):
+    """
+    Resolve fonts and pre-render labels ahead of the first frame.
+    specs is an iterable of (text, size, color) or (text, size, color, name, bold) tuples.
+    """
+    for spec in specs:
+        render(*spec)